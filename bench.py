@@ -0,0 +1,174 @@
+# bench.py
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from exchanges import ExchangeBase, register_exchange, configure_calls
+from metrics import metrics, percentile
+
+
+class SimulatedExchange(ExchangeBase):
+    """Exchange that answers from memory after a random delay, failing error_rate of its calls.
+    Subclasses made by make_exchange set the latency profile and the portfolio size."""
+    fiat = "USDT"
+    prices_by_asset = True
+
+    latency = 0.1
+    jitter = 0.05
+    error_rate = 0.0
+    assets = 50
+
+    def __init__(self, account_name, exchange_name, api_key, api_secret):
+        super().__init__(account_name, exchange_name, api_key)
+        # Same portfolio every run for the same account
+        rng = random.Random(f"{exchange_name}_{account_name}")
+        self.balance = {f"A{i:03d}": round(rng.uniform(1, 1000), 3) for i in range(self.assets)}
+        self.prices = {f"A{i:03d}USDT": round(random.Random(i).uniform(0.1, 100), 4) for i in range(self.assets)}
+
+    def _respond(self, value):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            raise ConnectionError(f"simulated {self.exchange_name} failure")
+        return value
+
+    def get_balance(self):
+        return self._respond(dict(self.balance))
+
+    def get_prices(self, assets=None):
+        if assets is None:
+            return self._respond(dict(self.prices))
+        return self._respond({f"{asset}USDT": self.prices[f"{asset}USDT"] for asset in assets if f"{asset}USDT" in self.prices})
+
+    def get_markets(self):
+        return self._respond([
+            {"symbol": f"{asset}USDT", "base": asset, "quote": "USDT", "base_asset": asset, "quote_asset": "USDT",
+             "step": 0.001, "min_qty": 0.001, "min_notional": 1}
+            for asset in self.balance
+        ])
+
+    def buy(self, asset, amount):
+        return self._respond({"orderId": f"{asset}-{time.monotonic_ns()}"})
+
+    def sell(self, asset, amount):
+        return self._respond({"orderId": f"{asset}-{time.monotonic_ns()}"})
+
+    def get_margin_balance(self):
+        return self._respond({"USDT": {"borrowed": 100.0, "free": 50.0, "total": 150.0}})
+
+    def get_active_margin_loans(self):
+        return self._respond({"USDT": 100.0})
+
+    def get_margin_snapshot(self):
+        return self._respond({"balances": {"USDT": {"borrowed": 100.0, "free": 50.0, "total": 150.0}},
+                              "loans": {"USDT": 100.0}})
+
+
+def make_exchange(exchange_name, **profile):
+    """Create a SimulatedExchange subclass with the given latency, jitter, error_rate and assets and register it"""
+    cls = type(f"Simulated_{exchange_name}", (SimulatedExchange,), profile)
+    register_exchange(exchange_name, cls)
+    return cls
+
+
+def make_config(exchanges, accounts, live):
+    """Build the config of the simulated exchanges, each with the same number of accounts"""
+    from config import Config, validate
+
+    data = {
+        "live": live,
+        "stable_assets": ["USDT"],
+        "skip_assets": ["USDT"],
+        "skip_small_asset_usd": 0,
+        "max_workers": 8,
+        "call_timeout": 60,
+        "price_feed": {"enabled": False},
+        "warm_start": False,
+        "order_concurrency": {name: 5 for name in exchanges},
+        "accounts": {name: [f"acct{i}" for i in range(accounts)] for name in exchanges},
+    }
+    for name in exchanges:
+        for account_name in data["accounts"][name]:
+            os.environ.setdefault(f"{name.upper()}_{account_name.upper()}_API_KEY", f"key-{name}-{account_name}")
+            os.environ.setdefault(f"{name.upper()}_{account_name.upper()}_API_SECRET", "secret")
+    errors = validate(data)
+    if errors:
+        raise ValueError("; ".join(errors))
+    return Config(data)
+
+
+def print_report(scenario, wall_times):
+    print(f"\n{scenario}: wall time per run (ms) " + " ".join(f"{seconds * 1000:.0f}" for seconds in wall_times)
+          + f"  best {min(wall_times) * 1000:.0f}")
+    print("-" * 80)
+    print(f"{'Exchange':<12}{'Operation':<26}{'Calls':>8}{'Errors':>8}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    print("-" * 80)
+    # The exchange call spans recorded by the call wrapper, all accounts of an exchange together
+    calls = {}
+    for (operation, exchange_name, _), histogram in list(metrics.histograms.items()):
+        if exchange_name and operation in SimulatedExchange.__dict__:
+            series = calls.setdefault((exchange_name, operation), [[], 0, 0])
+            series[0].extend(histogram.samples)
+            series[1] += histogram.count
+            series[2] += histogram.errors
+    for (exchange_name, operation), (latencies, count, errors) in sorted(calls.items()):
+        latencies.sort()
+        print(f"{exchange_name:<12}{operation:<26}{count:>8}{errors:>8}"
+              f"{percentile(latencies, 50) * 1000:>12.1f}{percentile(latencies, 99) * 1000:>12.1f}")
+    print("-" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the balance, trade and margin commands against simulated exchanges")
+    parser.add_argument("--exchanges", type=int, default=4, help="number of simulated exchanges")
+    parser.add_argument("--accounts", type=int, default=3, help="accounts per exchange")
+    parser.add_argument("--assets", type=int, default=50, help="assets held per account")
+    parser.add_argument("--latency", type=float, default=0.1, help="mean seconds per exchange call")
+    parser.add_argument("--jitter", type=float, default=0.05, help="standard deviation of the call latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls that fail")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per scenario")
+    parser.add_argument("--percent", type=float, default=10, help="percent traded by the sell scenario")
+    parser.add_argument("--simulate", action="store_true", help="run the sell scenario with live false, orders are printed instead of sent")
+    parser.add_argument("--warm", action="store_true", help="keep the balance and price caches between runs")
+    parser.add_argument("--scenarios", default="balance,sell,margin", help="comma separated, from balance, sell, margin")
+    args = parser.parse_args()
+
+    # Snapshots and market caches go to a scratch directory, simulated orders stay out of trade.log
+    os.chdir(tempfile.mkdtemp(prefix="asset-manager-bench-"))
+    import commands
+    from logger import get_logger
+    get_logger().disabled = True
+
+    names = [f"sim{i}" for i in range(args.exchanges)]
+    for name in names:
+        make_exchange(name, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, assets=args.assets)
+    config = make_config(names, args.accounts, not args.simulate)
+    # Simulated failures should show up as errors, not open the circuit for the remaining runs
+    configure_calls(failures=10 ** 9)
+
+    scenarios = {
+        'balance': lambda: commands.show_balance('all', config, fresh=not args.warm),
+        'sell': lambda: commands.perform_trade('sell', args.percent, 'all', config),
+        'margin': lambda: commands.handle_margin(config),
+    }
+    print(f"{args.exchanges} exchanges x {args.accounts} accounts x {args.assets} assets, "
+          f"latency {args.latency * 1000:.0f}±{args.jitter * 1000:.0f} ms, error rate {args.error_rate:.0%}")
+    for scenario in args.scenarios.split(','):
+        metrics.reset()
+        wall_times = []
+        for _ in range(args.rounds):
+            if not args.warm:
+                commands.balance_cache.invalidate()
+                commands.price_cache.invalidate()
+                commands.margin_cache.invalidate()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                scenarios[scenario]()
+            wall_times.append(time.perf_counter() - start)
+        print_report(scenario, wall_times)
+
+
+if __name__ == "__main__":
+    main()
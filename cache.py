@@ -0,0 +1,82 @@
+# cache.py
+import json
+import os
+import threading
+import time
+
+# Directory for caches that survive restarts
+CACHE_DIR = "cache"
+
+
+class TTLCache:
+    """Thread-safe in-memory cache with per-entry expiry and single-flight fetches"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}   # key -> (stored_at, value)
+        self._inflight = {}  # key -> threading.Event of the fetch currently running
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch, ttl=None, valid=None):
+        """Return the cached value for key, calling fetch() when it is missing, older than ttl or valid(value) is False.
+        Concurrent callers for the same key wait for the one fetch in flight instead of starting their own."""
+        ttl = self.ttl if ttl is None else ttl
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and time.monotonic() - entry[0] < ttl and (valid is None or valid(entry[1])):
+                    return entry[1]
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    waiter = self._inflight[key] = threading.Event()
+                    break
+            # Someone else is fetching, wait for it and re-check the entry
+            waiter.wait()
+
+        try:
+            value = fetch()
+            with self._lock:
+                self._entries[key] = (time.monotonic(), value)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            waiter.set()
+
+    def peek(self, key, ttl=None):
+        """Return the cached value for key if it is younger than ttl, else None, never fetches"""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[0] < ttl:
+            return entry[1]
+        return None
+
+    def invalidate(self, key=None):
+        """Drop one entry, or every entry when key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+def load_json(name, max_age, fetch):
+    """Return the JSON document cached on disk under name, calling fetch() and rewriting the file
+    when it is missing or older than max_age seconds"""
+    path = os.path.join(CACHE_DIR, f"{name}.json")
+    try:
+        if time.time() - os.path.getmtime(path) < max_age:
+            with open(path, "r") as file:
+                return json.load(file)
+    except (OSError, ValueError):
+        pass
+
+    data = fetch()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Write to a temp file first so a crash or a concurrent writer never leaves a truncated cache behind
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+    return data
@@ -0,0 +1,59 @@
+# client.py
+# Thin client of the daemon (python3 main.py --daemon), only the standard library is imported so it starts instantly
+import os
+import socket
+import sys
+
+# Where the daemon listens, relative to the app folder like trade.log and config/
+SOCKET_PATH = os.getenv('ASSET_MANAGER_SOCKET', 'asset-manager.sock')
+
+# Ends the streamed output of a command, followed by the command's exit code
+END = b'\0'
+
+
+def send(command, output=None, path=SOCKET_PATH):
+    """Run one command on the daemon, writing its output to output as it arrives. Returns the command's exit code."""
+    output = output or sys.stdout.buffer
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        connection.sendall(command.encode() + b'\n')
+        status = None
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            if status is not None:
+                status += chunk
+                continue
+            text, end, rest = chunk.partition(END)
+            output.write(text)
+            output.flush()
+            if end:
+                status = rest
+    # No status means the daemon went away in the middle of the command
+    return int(status) if status else 1
+
+
+def main():
+    if sys.argv[1:]:
+        commands = [' '.join(sys.argv[1:])]
+    else:
+        # One command per line, eg: a script piped in, lines starting with # are skipped
+        lines = [line.strip() for line in sys.stdin]
+        commands = [line for line in lines if line and not line.startswith('#')]
+    if not commands:
+        print("usage: python3 client.py balance all   (or one command per line on stdin)")
+        return 2
+
+    failed = 0
+    for command in commands:
+        try:
+            failed += send(command) != 0
+        except (FileNotFoundError, ConnectionRefusedError):
+            print(f"No daemon listening on {SOCKET_PATH}, start it with: python3 main.py --daemon")
+            return 2
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,122 +1,252 @@
-from utils import get_time, amount_trade, parse_command, filter_assets, calculate_changes, get_asset_usd_value, sort_assets_by_value
-from exchanges import get_exchange
+from utils import get_time, parse_since, parse_command, filter_assets, calculate_changes, get_asset_usd_value, sort_assets_by_value, run_parallel
+from exchanges import get_exchange, invalidate_exchange, CircuitOpen
 from logger import get_logger
 from config import load_config
+from cache import TTLCache
+from executor import new_order, dispatch_orders, print_order_summary
+from quantity import get_market_rules, order_quantity
+from store import snapshot_store
+from metrics import metrics
+from symbols import get_symbol_index
+import threading
+import time
 
 
 logger = get_logger()
 
-# Caching balances in memory
-exchange_balances = {}
+# Caching balances in memory per exchange-account, dropped after orders are placed on the account
+balance_cache = TTLCache(ttl=60)
+
+# Caching prices in memory per exchange, shared by all accounts of that exchange
+price_cache = TTLCache(ttl=30)
+
+# Margin balances and loans per exchange-account, kept briefly as they move with prices
+margin_cache = TTLCache(ttl=10)
+
+# The consolidated holdings table of every account, re-sorted and filtered by portfolio commands without refetching
+portfolio_cache = TTLCache(ttl=60)
 
 def execute_command(command):
-    """Parse and execute the commands"""
+    """Parse and execute the commands, returns False when the command or any part of it failed"""
     print(get_time())
     # Load config
     config = load_config()
     
-    action, percent, target = parse_command(command)
-    
-    if action == 'balance':
-        show_balance(target, config)
-    elif action in ['buy', 'sell']:
-        if percent and target:
-            perform_trade(action, percent, target, config)
+    action, percent, target, options = parse_command(command)
+    if action == 'stats':
+        return show_stats(target, config, options)
+
+    # Time the command and every exchange call and phase it runs, --timings prints the breakdown
+    try:
+        with metrics.collect() as spans, metrics.span(f"command:{action}"):
+            return run_command(action, percent, target, options, config)
+    finally:
+        if options.get('timings'):
+            print_timings(spans)
+        prometheus_file = config.get('metrics', {}).get('prometheus_file')
+        if prometheus_file:
+            metrics.write_prometheus(prometheus_file)
+
+def run_command(action, percent, target, options, config):
+    """Dispatch a parsed command to its handler"""
+    if action == 'balance' and options.get('watch'):
+        # Imported here as the watch loop builds on the balance helpers of this module
+        from watch import watch_balance
+        interval = float(options['watch']) if options['watch'] is not True else None
+        duration = float(options['duration']) if 'duration' in options else None
+        return watch_balance(target, config, interval, duration)
+    elif action == 'balance':
+        return show_balance(target, config, bool(options.get('fresh')))
+    elif action in ['buy', 'sell'] and percent and target:
+        deadline = float(options['deadline']) if 'deadline' in options else None
+        return perform_trade(action, percent, target, config, deadline)
     elif action == 'margin':
-        handle_margin(config)
+        return handle_margin(config, bool(options.get('fresh')))
+    elif action == 'refresh':
+        return handle_refresh(target)
+    elif action == 'portfolio':
+        return show_portfolio(target, config, options)
+    elif action == 'history':
+        return show_history(target, parse_since(options['since']) if 'since' in options else None)
     else:
         print("Invalid command!")
+        return False
 
-def perform_trade(action, percent, target, config):
+def perform_trade(action, percent, target, config, deadline=None):
     """
     Handle buy or sell action across specified exchanges and accounts.
+    Accounts are traded concurrently and every order outcome is reported in one summary table.
     """
-    # Parse the target to determine the exchange and account
-    if target == 'all':
-        target_exchange, target_account = None, None
+    # Orders not sent within deadline seconds of the command are reported as unsent
+    if deadline is not None:
+        deadline = time.monotonic() + deadline
+
+    pairs = [(action, percent, exchange_name, account_name, config, deadline)
+             for exchange_name, account_name in config.pairs(target)]
+
+    # Delegate the trade operation to perform_trade_for_account, one thread per account
+    orders = []
+    for (_, _, exchange_name, account_name, _, _), account_orders, error in run_parallel(perform_trade_for_account, pairs, len(pairs)):
+        if error:
+            failed = new_order(exchange_name, account_name, action, '-', 0)
+            # Accounts behind an open circuit were not tried at all
+            failed['status'] = 'unsent' if isinstance(error, CircuitOpen) else 'error'
+            failed['detail'] = str(error)
+            orders.append(failed)
+        else:
+            orders.extend(account_orders)
+
+    print_order_summary(orders)
+    return all(order['status'] not in ['rejected', 'error', 'unsent'] for order in orders)
+
+def handle_refresh(target):
+    """Drop cached state so it is rebuilt on the next command"""
+    if target == 'clients':
+        invalidate_exchange()
+        print("Exchange clients will be recreated on next use.")
+    elif target == 'balances':
+        balance_cache.invalidate()
+        portfolio_cache.invalidate()
+        margin_cache.invalidate()
+        print("Balances will be fetched again on next use.")
+    elif target == 'prices':
+        price_cache.invalidate()
+        portfolio_cache.invalidate()
+        print("Prices will be fetched again on next use.")
     else:
-        target_exchange, target_account = target.split('_')
+        print(f"Unknown refresh target: {target}")
+        return False
+    return True
 
-    exchanges = config['accounts']
-    for exchange_name, accounts in exchanges.items():
-        # Skip if the exchange doesn't match the target
-        if target_exchange and exchange_name != target_exchange:
+def get_margin_snapshot(exchange_name, account_name, config, fresh=False):
+    """Get the margin balances and loans of the account, from cache or with one snapshot fetch"""
+    exchange = get_exchange(exchange_name, account_name)
+    ttl = 0 if fresh else config.get('margin_cache_ttl', margin_cache.ttl)
+    return margin_cache.get(f"{exchange_name}_{account_name}", exchange.get_margin_snapshot, ttl)
+
+def handle_margin(config, fresh=False):
+    """Handle margin-related commands, every account is fetched concurrently and shown in config order"""
+    ok = True
+    pairs = [(exchange_name, account_name, config, fresh) for exchange_name, account_name in config.pairs('all')]
+    for (exchange_name, account_name, _, _), snapshot, error in run_parallel(
+            get_margin_snapshot, pairs, config.get('max_workers', 8), config.call_timeout(1, len(pairs))):
+        if error:
+            print(f"❌ Error handling margin for {account_name} on {exchange_name}: {error}")
+            ok = False
+            continue
+        # Exchanges without a margin account have nothing to show
+        if snapshot is None:
             continue
 
-        for account_name in accounts:
-            # Skip if the account doesn't match the target
-            if target_account and account_name != target_account:
-                continue
-
-            # Delegate the trade operation to perform_trade_for_account
-            perform_trade_for_account(action, percent, exchange_name, account_name, config)
-
-def handle_margin(config):
-    """Handle margin-related commands"""
-    accounts = config.get('accounts', {})
-    
-    for exchange_name, account_names in accounts.items():
-        for account_name in account_names:
-            try:
-                exchange = get_exchange(exchange_name, account_name)
-                
-                if hasattr(exchange, 'get_margin_balance'):
-                    margin_balance = exchange.get_margin_balance()
-                    if exchange_name == 'bitfinex':
-                        display_margin_balances_bitfinex(account_name, exchange.exchange_name, margin_balance)
-                    else:
-                        display_margin_balances(account_name, exchange.exchange_name, margin_balance)
-                
-                # Fetch and display active margin loans
-                if hasattr(exchange, 'get_active_margin_loans'):
-                    active_loans = exchange.get_active_margin_loans()
-                    if exchange_name == 'bitfinex':
-                        display_active_loans_bitfinex(account_name, exchange.exchange_name, active_loans)
-                    else:
-                        display_active_loans(account_name, exchange.exchange_name, active_loans)
-                
-            except Exception as e:
-                print(f"❌ Error handling margin for {account_name} on {exchange_name}: {e}")
-
-def perform_trade_for_account(action, percent, exchange_name, account_name, config):
+        if snapshot['balances'] is not None:
+            if exchange_name == 'bitfinex':
+                display_margin_balances_bitfinex(account_name, exchange_name, snapshot['balances'])
+            else:
+                display_margin_balances(account_name, exchange_name, snapshot['balances'])
+
+        # Display active margin loans
+        if snapshot['loans'] is not None:
+            if exchange_name == 'bitfinex':
+                display_active_loans_bitfinex(account_name, exchange_name, snapshot['loans'])
+            else:
+                display_active_loans(account_name, exchange_name, snapshot['loans'])
+    return ok
+
+def perform_trade_for_account(action, percent, exchange_name, account_name, config, deadline=None):
     """
     Perform buy or sell operations for a specific exchange and account.
+    Returns the order records with the outcome of each order.
     """
-    # Prepare balance data for the specified account
-    sorted_assets, _ = prepare_balance_for_account(exchange_name, account_name, config)
+    # Prepare balance data for the specified account, never trade on cached positions
+    sorted_assets, _ = prepare_balance_for_account(exchange_name, account_name, config, fresh=True)
+
+    # Get exchange instance
+    exchange = get_exchange(exchange_name, account_name)
 
     # Filter out assets listed in the skip_assets configuration
-    skip_assets = config.get("skip_assets", [])
     filtered_assets = [
-        asset_data for asset_data in sorted_assets if asset_data[0] not in skip_assets
+        asset_data for asset_data in sorted_assets if asset_data[0] not in config.skip_assets
     ]
 
-    for asset, amount, usd_value, _, _ in filtered_assets:
-        # Calculate the amount to trade
-        amount_to_trade = amount_trade(asset, amount, percent)
-
-        # Get exchange instance
-        exchange = get_exchange(exchange_name, account_name)
-        
-        # Log the action if live flag is True
-        if config['live']:
-            # Perform the buy/sell operation using exchange's API
-            if action == 'buy':
-                exchange.buy(asset, amount_to_trade)
-            elif action == 'sell':
-                exchange.sell(asset, amount_to_trade)
-            logger.info(f"{action.capitalize()} {amount_to_trade} of {asset} on {exchange_name}_{account_name}")
-        else:
-            print(f"[Simulation] {action.capitalize()} {amount_to_trade} of {asset} on {exchange_name}_{account_name}")
+    # Order size rules of the exchange, without them amounts fall back to guessed decimals
+    try:
+        with metrics.span('market_rules', exchange_name, account_name):
+            rules = get_market_rules(exchange)
+    except Exception as e:
+        print(f"Warning: market rules for {exchange_name} unavailable: {e}")
+        rules = {}
 
-
-def get_balance(exchange_name, account_name, exchange):
+    orders = []
+    for asset, amount, usd_value, _, _ in filtered_assets:
+        # Calculate the amount to trade, rounded to the market's step size
+        amount_to_trade, skip_reason = order_quantity(rules, asset, amount, percent, usd_value / amount)
+        order = new_order(exchange_name, account_name, action, asset, amount_to_trade)
+        if skip_reason:
+            # The exchange would reject it, do not spend a round trip on it
+            order['status'], order['detail'] = 'skipped', skip_reason
+        orders.append(order)
+
+    # Send the orders with up to order_concurrency of them in flight on this account, only print if live is False
+    max_concurrency = config.get('order_concurrency', {}).get(exchange_name, 1)
+    with metrics.span('dispatch_orders', exchange_name, account_name):
+        dispatch_orders(exchange, orders, max_concurrency, config['live'], deadline)
+
+    # Positions changed, the next balance or trade must see the post-trade numbers
+    if config['live'] and orders:
+        balance_cache.invalidate(f"{exchange_name}_{account_name}")
+        portfolio_cache.invalidate()
+        margin_cache.invalidate(f"{exchange_name}_{account_name}")
+    return orders
+
+
+def get_balance(exchange_name, account_name, exchange, config, fresh=False):
     """Get balance data, either from cache or by fetching it from the exchange"""
-    if f"{exchange_name}_{account_name}" not in exchange_balances:
+    def fetch():
         print(f"Fetching balance for {exchange_name}_{account_name}...")
-        balance_data = exchange.get_balance()
-        exchange_balances[f"{exchange_name}_{account_name}"] = balance_data
-    return exchange_balances[f"{exchange_name}_{account_name}"]
+        return exchange.get_balance()
+
+    ttl = 0 if fresh else config.get('balance_cache_ttl', balance_cache.ttl)
+    return balance_cache.get(f"{exchange_name}_{account_name}", fetch, ttl)
+
+def get_rest_prices(exchange_name, exchange, assets, ttl):
+    """Get the cached price snapshot of the exchange, covering the assets asked for by all of its accounts"""
+    # None means the snapshot holds every price of the exchange
+    wanted = set(assets) if exchange.prices_by_asset and assets is not None else None
+
+    def covers(snapshot):
+        covered, _ = snapshot
+        return covered is None or (wanted is not None and wanted <= covered)
+
+    def fetch():
+        if wanted is None:
+            return None, exchange.get_prices()
+        # Keep the assets of the accounts already priced so they do not refetch either
+        current = price_cache.peek(exchange_name, ttl)
+        union = wanted | current[0] if current and current[0] is not None else wanted
+        return union, exchange.get_prices(union)
+
+    _, prices = price_cache.get(exchange_name, fetch, ttl, valid=covers)
+    return prices
+
+def get_prices(exchange_name, exchange, config, assets=None):
+    """Get price data for the exchange, from the live price feed when enabled, else from cache or the exchange.
+    assets are the balance codes to value, exchanges with prices_by_asset only fetch what those need"""
+    ttl = config.get('price_cache_ttl', price_cache.ttl)
+    fetch_rest = lambda: get_rest_prices(exchange_name, exchange, assets, ttl)
+
+    feed_config = config.get('price_feed', {})
+    if not feed_config.get('enabled'):
+        return fetch_rest()
+    # websockets and asyncio are only loaded once the feed is enabled
+    from feeds import BookPrices, price_book, price_feeds
+
+    if not price_feeds.covers(exchange_name, assets):
+        # The REST snapshot tells the feed which symbols to subscribe to, the first one starts it and the
+        # snapshots of assets it does not stream yet (eg: another account's) add their symbols
+        prices = fetch_rest()
+        price_feeds.start(exchange_name, exchange, list(prices), assets, feed_config.get('urls', {}).get(exchange_name))
+        return prices
+    return BookPrices(price_book, exchange_name, feed_config.get('max_age', 30), fetch_rest)
 
 def filter_balance(balance_data, prices, config, exchange):
     """Filter balance data by adding USD value and applying filters like skip_assets and skip_small_asset_usd"""
@@ -127,21 +257,27 @@ def filter_balance(balance_data, prices, config, exchange):
             filtered_balance_with_usd[asset] = usd_value
     return filter_assets(filtered_balance_with_usd, [], config.get('skip_small_asset_usd', 0))
 
-def prepare_balance_for_account(exchange_name, account_name, config):
-    """Prepare balance data for a specific account"""
+def prepare_balance_for_account(exchange_name, account_name, config, fresh=False):
+    """Prepare balance data for a specific account, fresh skips the cached balance"""
     exchange = get_exchange(exchange_name, account_name)
-    balance_data = get_balance(exchange_name, account_name, exchange)
-    prices = exchange.get_prices()
+    # Cache hits are timed too, the spans show what the command actually waited for
+    with metrics.span('balance', exchange_name, account_name):
+        balance_data = get_balance(exchange_name, account_name, exchange, config, fresh)
+    with metrics.span('prices', exchange_name, account_name):
+        prices = get_prices(exchange_name, exchange, config, list(balance_data))
 
-    filtered_balance = filter_balance(balance_data, prices, config, exchange)
+    with metrics.span('valuation', exchange_name, account_name):
+        filtered_balance = filter_balance(balance_data, prices, config, exchange)
 
-    asset_list = []
-    for asset, usd_value in filtered_balance.items():
-        amount = balance_data.get(asset, 0)
-        asset_list.append((asset, amount, usd_value, exchange_name, account_name))
+        asset_list = []
+        for asset, usd_value in filtered_balance.items():
+            amount = balance_data.get(asset, 0)
+            asset_list.append((asset, amount, usd_value, exchange_name, account_name))
 
-    sorted_assets = sort_assets_by_value(asset_list)
-    total_value = sum(usd_value for _, _, usd_value, _, _ in sorted_assets)
+        sorted_assets = sort_assets_by_value(asset_list)
+        total_value = sum(usd_value for _, _, usd_value, _, _ in sorted_assets)
+
+    snapshot_store.save_account(exchange_name, account_name, balance_data, sorted_assets, total_value)
 
     return sorted_assets, total_value
 
@@ -156,24 +292,223 @@ def print_balance_for_account(sorted_assets, total_value, exchange_name, account
     else:
         print(f"{'Total Value for Exchange':<50}{total_value:<15.2f}")
 
-def show_balance(target, config):
-    """Display balances from exchanges"""
-    if target == 'all':
-        for exchange_name, accounts in config['accounts'].items():
-            total_exchange_value = 0
-            print(f"\nBalance for Exchange: {exchange_name}")
-            print("=" * 60)
-            for account_name in accounts:
-                sorted_assets, account_total_value = prepare_balance_for_account(exchange_name, account_name, config)
-                print_balance_for_account(sorted_assets, account_total_value, exchange_name, account_name)
-                total_exchange_value += account_total_value
-
-            print("=" * 60)
-            print(f"{'Total Value for Exchange':<50}{total_exchange_value:<15.2f}")
+def print_exchange_total(total_exchange_value):
+    """Print the subtotal line closing an exchange block"""
+    print("=" * 60)
+    print(f"{'Total Value for Exchange':<50}{total_exchange_value:<15.2f}")
+
+def show_balance(target, config, fresh=False):
+    """Display balances from exchanges, fresh refetches them instead of using cached balances"""
+    pairs = [(exchange_name, account_name, config, fresh) for exchange_name, account_name in config.pairs(target)]
+    if target == 'all' or target in config['accounts']:
+        # Fetch every account concurrently, results still come back in config order
+        # A balance read and a price read per account
+        results = run_parallel(prepare_balance_for_account, pairs,
+                               config.get('max_workers', 8), config.call_timeout(2, len(pairs)))
+
+        current_exchange, total_exchange_value, skipped = None, 0, []
+        ok = True
+        for (exchange_name, account_name, _, _), result, error in results:
+            if exchange_name != current_exchange:
+                if current_exchange is not None:
+                    print_exchange_total(total_exchange_value)
+                current_exchange, total_exchange_value = exchange_name, 0
+                print(f"\nBalance for Exchange: {exchange_name}")
+                print("=" * 60)
+
+            if isinstance(error, CircuitOpen):
+                print(f"⏸  Skipped {exchange_name}_{account_name}: {error}")
+                skipped.append(f"{exchange_name}_{account_name}")
+            elif error:
+                print(f"❌ Error fetching balance for {exchange_name}_{account_name}: {error}")
+                logger.error(f"Error fetching balance for {exchange_name}_{account_name}: {error}")
+            if error:
+                print(" " * 60)
+                ok = False
+                continue
+            sorted_assets, account_total_value = result
+            print_balance_for_account(sorted_assets, account_total_value, exchange_name, account_name)
+            total_exchange_value += account_total_value
+
+        if current_exchange is not None:
+            print_exchange_total(total_exchange_value)
+        if skipped:
+            print(f"\n⏸  Not included, failing repeatedly: {', '.join(skipped)}")
+        return ok
     else:
-        exchange_name, account_name = target.split('_')
-        sorted_assets, account_total_value = prepare_balance_for_account(exchange_name, account_name, config)
+        exchange_name, account_name, _, _ = pairs[0]
+        sorted_assets, account_total_value = prepare_balance_for_account(exchange_name, account_name, config, fresh)
         print_balance_for_account(sorted_assets, account_total_value, exchange_name, account_name)
+        return True
+
+def get_account_holdings(exchange_name, account_name, config, fresh=False):
+    """Return (asset, exchange, account, amount, price) rows of every balance of the account, assets by canonical name
+    and price None when the exchange has no USD price for it"""
+    exchange = get_exchange(exchange_name, account_name)
+    balance_data = get_balance(exchange_name, account_name, exchange, config, fresh)
+    prices = get_prices(exchange_name, exchange, config, list(balance_data))
+    index = get_symbol_index(exchange)
+    return [
+        (index.canonical(code), exchange_name, account_name, amount, index.usd_value(code, 1, prices))
+        for code, amount in balance_data.items() if amount > 0
+    ]
+
+def load_portfolio(config, fresh=False):
+    """Return (table, failed accounts) for every configured account, reusing the last table while it is fresh.
+    A table missing failed accounts is rebuilt on the next call instead of being reused."""
+    # NumPy is only loaded by the portfolio commands, it would add to every startup
+    from portfolio import PortfolioTable
+
+    def build():
+        pairs = [(exchange_name, account_name, config, fresh) for exchange_name, account_name in config.pairs('all')]
+        rows, failed = [], []
+        for (exchange_name, account_name, _, _), result, error in run_parallel(
+                get_account_holdings, pairs, config.get('max_workers', 8), config.call_timeout(2, len(pairs))):
+            if error:
+                logger.error(f"Error fetching balance for {exchange_name}_{account_name}: {error}")
+                failed.append((f"{exchange_name}_{account_name}", error))
+                continue
+            rows.extend(result)
+        return PortfolioTable.from_rows(rows), failed
+
+    ttl = 0 if fresh else config.get('balance_cache_ttl', portfolio_cache.ttl)
+    return portfolio_cache.get('all', build, ttl=ttl, valid=lambda entry: not entry[1])
+
+def show_portfolio(target, config, options):
+    """Display the holdings of every account consolidated per asset, or one asset's holdings per account"""
+    from portfolio import SORT_KEYS
+    sort = options.get('sort', 'value')
+    if sort not in SORT_KEYS:
+        print(f"Unknown sort {sort}, expected one of {', '.join(SORT_KEYS)}")
+        return False
+    table, failed = load_portfolio(config, bool(options.get('fresh')))
+    for account, error in failed:
+        print(f"❌ Error fetching balance for {account}: {error}")
+    if options.get('exchange'):
+        table = table.filter(exchange_name=options['exchange'])
+
+    if target != 'all':
+        return print_asset_holdings(table.filter(asset=target.upper()), target.upper()) and not failed
+
+    min_value = float(options.get('min', config.get('skip_small_asset_usd', 0)))
+    assets, amounts, values, weights, exchanges, per_exchange = table.by_asset(sort, min_value)
+    if 'top' in options:
+        assets, amounts, values, weights, per_exchange = (column[:int(options['top'])] for column in (assets, amounts, values, weights, per_exchange))
+
+    print(f"{'Asset':<10}{'Amount':>18}{'Value':>14}{'Weight':>9}" + "".join(f"{name:>12}" for name in exchanges))
+    print("-" * (51 + 12 * len(exchanges)))
+    for asset, amount, value, weight, row in zip(assets, amounts, values, weights, per_exchange):
+        print(f"{asset:<10}{amount:>18.8g}{value:>14.2f}{weight:>8.1%} " + "".join(f"{cell:>12.2f}" for cell in row))
+    print("-" * (51 + 12 * len(exchanges)))
+    print(f"{'Total Portfolio Value':<28}{table.total():>14.2f}")
+    unpriced = table.unpriced()
+    if unpriced:
+        print(f"No USD price for: {', '.join(unpriced)}")
+    return not failed
+
+def print_asset_holdings(table, asset):
+    """Print where one asset is held, one row per exchange-account"""
+    import numpy as np
+    if not len(table):
+        print(f"No {asset} held in any account.")
+        return True
+    order = np.argsort(-np.nan_to_num(table.values), kind='stable')
+    print(f"{'Account':<28}{'Amount':>18}{'Price':>14}{'Value':>14}")
+    print("-" * 74)
+    for i in order:
+        print(f"{table.exchanges[i] + '_' + table.accounts[i]:<28}{table.amounts[i]:>18.8g}"
+              f"{table.prices[i]:>14.6g}{table.values[i]:>14.2f}")
+    print("-" * 74)
+    print(f"{'Total ' + asset:<28}{table.amounts.sum():>18.8g}{'':>14}{table.total():>14.2f}")
+    return True
+
+def warm_start():
+    """Show the last known balances from the snapshot store right away and refresh every account in the background"""
+    config = load_config()
+    if not config.get('warm_start', True):
+        return
+    show_last_known_balance(config)
+
+    pairs = [(exchange_name, account_name, config) for exchange_name, account_name in config.pairs('all')]
+
+    def refresh():
+        for (exchange_name, account_name, _), _, error in run_parallel(prepare_balance_for_account, pairs, config.get('max_workers', 8)):
+            if error:
+                logger.error(f"Error refreshing {exchange_name}_{account_name} at startup: {error}")
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+def show_last_known_balance(config):
+    """Print the last saved snapshot of every configured account"""
+    grand_total = 0
+    for exchange_name, account_name in config.pairs('all'):
+        snapshot = snapshot_store.latest(exchange_name, account_name)
+        if snapshot is None:
+            continue
+        taken_at, total_value, assets = snapshot
+        print(f"Last known balance for {exchange_name}_{account_name} at {get_time(taken_at)}")
+        sorted_assets = [(asset, amount, usd_value, exchange_name, account_name) for asset, amount, usd_value in assets]
+        print_balance_for_account(sorted_assets, total_value, exchange_name, account_name)
+        grand_total += total_value
+    if grand_total:
+        print(f"{'Last Known Total Value':<50}{grand_total:<15.2f}")
+        print(" " * 60)
+
+def show_history(target, since=None):
+    """Display past account totals from the snapshot store"""
+    exchange_name, account_name = None, None
+    if target != 'all':
+        exchange_name, _, account_name = target.partition('_')
+
+    rows = snapshot_store.history(exchange_name, account_name or None, since)
+    if not rows:
+        print(f"No history found for {target}.")
+        return True
+
+    print(f"{'Time':<22}{'Account':<28}{'Total Value':<15}")
+    print("-" * 60)
+    for taken_at, exchange, account, total_value in rows:
+        print(f"{get_time(taken_at):<22}{exchange + '_' + account:<28}{total_value:<15.2f}")
+    print("-" * 60)
+    return True
+
+def show_stats(target, config, options):
+    """Display the latency histograms and counters collected since startup, or reset or export them"""
+    if target == 'reset':
+        metrics.reset()
+        print("Stats cleared.")
+        return True
+    if target == 'export':
+        path = options.get('file') or config.get('metrics', {}).get('prometheus_file')
+        if not path or path is True:
+            print("No export file, pass --file {path} or set metrics.prometheus_file in config.json")
+            return False
+        metrics.write_prometheus(path)
+        print(f"Stats written to {path}")
+        return True
+
+    print(f"{'Operation':<24}{'Exchange':<12}{'Account':<12}{'Calls':>8}{'Errors':>8}{'p50 (ms)':>11}{'p99 (ms)':>11}{'Total (s)':>11}")
+    print("-" * 97)
+    for (operation, exchange_name, account_name), histogram in sorted(metrics.histograms.items()):
+        print(f"{operation:<24}{exchange_name:<12}{account_name:<12}{histogram.count:>8}{histogram.errors:>8}"
+              f"{histogram.percentile(50) * 1000:>11.1f}{histogram.percentile(99) * 1000:>11.1f}{histogram.sum:>11.2f}")
+    print("-" * 97)
+    for (name, exchange_name, account_name), value in sorted(metrics.counters.items()):
+        print(f"{name:<24}{exchange_name:<12}{account_name:<12}{value:>8}")
+    return True
+
+def print_timings(spans):
+    """Print where the time of one command went, per operation and exchange, slowest first"""
+    totals = {}
+    for operation, exchange_name, _, seconds, ok in spans:
+        calls, total, slowest, errors = totals.get((operation, exchange_name), (0, 0.0, 0.0, 0))
+        totals[(operation, exchange_name)] = (calls + 1, total + seconds, max(slowest, seconds), errors + (not ok))
+
+    print(f"\n{'Operation':<24}{'Exchange':<12}{'Calls':>8}{'Errors':>8}{'Total (ms)':>12}{'Max (ms)':>12}")
+    print("-" * 76)
+    for (operation, exchange_name), (calls, total, slowest, errors) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        print(f"{operation:<24}{exchange_name:<12}{calls:>8}{errors:>8}{total * 1000:>12.1f}{slowest * 1000:>12.1f}")
+    print("-" * 76)
 
 # utils.py
 
@@ -1,6 +1,148 @@
 import json
+import math
+import os
+import threading
+from exchanges import ADAPTERS, call_policy, call_budget, configure_calls
+
+CONFIG_PATH = "config/config.json"
+
+# Seconds added to the exchange call budget of a command, for rate limit waits and the work between calls
+CALL_SLACK = 5
+
+# Optional numeric settings and their lowest valid value
+NUMBERS = {
+    "skip_small_asset_usd": 0,
+    "price_cache_ttl": 0,
+    "balance_cache_ttl": 0,
+    "margin_cache_ttl": 0,
+    "call_timeout": 0,
+    "max_workers": 1,
+}
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class Config(dict):
+    """The parsed config.json, with the lookups every command needs computed once"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.skip_assets = frozenset(data.get("skip_assets", []))
+        self.stable_assets = frozenset(data.get("stable_assets", []))
+
+        # target -> [(exchange, account), ...] in config order, targets are all, an exchange or an exchange_account pair
+        self.targets = {"all": []}
+        for exchange_name, accounts in data["accounts"].items():
+            self.targets[exchange_name] = []
+            for account_name in accounts:
+                pair = (exchange_name, account_name)
+                self.targets["all"].append(pair)
+                self.targets[exchange_name].append(pair)
+                self.targets[f"{exchange_name}_{account_name}"] = [pair]
+
+    def pairs(self, target):
+        """Return the (exchange, account) pairs of the target"""
+        if target not in self.targets:
+            raise ValueError(f"Unknown target {target}, expected all, an exchange or an exchange_account from config.json")
+        return self.targets[target]
+
+    def call_timeout(self, calls=1, pairs=1):
+        """Seconds a command waits for pairs accounts that each make calls exchange reads in a row. It outlasts the
+        retries and timeouts of exchange_calls, so a hung or skipped account is reported by the call wrapper rather
+        than as a generic timeout. call_timeout only makes the wait longer."""
+        rounds = math.ceil(pairs / max(1, self.get("max_workers", 8)))
+        return max(self.get("call_timeout", 0), rounds * call_budget(calls) + CALL_SLACK)
+
+
+def validate(data):
+    """Return the list of problems in the config, empty when it is valid"""
+    if not isinstance(data, dict):
+        return ["config must be a JSON object"]
+
+    errors = []
+    if not isinstance(data.get("live"), bool):
+        errors.append("live must be true or false")
+
+    accounts = data.get("accounts")
+    if not isinstance(accounts, dict) or not accounts:
+        errors.append("accounts must map exchange names to lists of account names")
+        accounts = {}
+    for exchange_name, account_names in accounts.items():
+        if exchange_name not in ADAPTERS:
+            errors.append(f"accounts.{exchange_name}: unsupported exchange, expected one of {', '.join(ADAPTERS)}")
+        if not isinstance(account_names, list) or not account_names:
+            errors.append(f"accounts.{exchange_name} must be a non-empty list of account names")
+            continue
+        for account_name in account_names:
+            # Targets are written exchange_account, so the name itself cannot contain _
+            if not isinstance(account_name, str) or not account_name or "_" in account_name:
+                errors.append(f"accounts.{exchange_name}: invalid account name {account_name!r}")
+
+    for key in ("stable_assets", "skip_assets"):
+        value = data.get(key, [])
+        if not isinstance(value, list) or not all(isinstance(asset, str) for asset in value):
+            errors.append(f"{key} must be a list of asset codes")
+
+    for key, minimum in NUMBERS.items():
+        value = data.get(key, minimum)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < minimum:
+            errors.append(f"{key} must be a number of at least {minimum}")
+
+    if not isinstance(data.get("warm_start", True), bool):
+        errors.append("warm_start must be true or false")
+    if not isinstance(data.get("price_feed", {}), dict):
+        errors.append("price_feed must be an object")
+    watch = data.get("balance_watch", {})
+    if not isinstance(watch, dict) or not isinstance(watch.get("urls", {}), dict) or not isinstance(watch.get("streams", True), bool):
+        errors.append("balance_watch must be an object with streams true or false and a urls object")
+    elif isinstance(watch.get("interval", 1), bool) or not isinstance(watch.get("interval", 1), (int, float)) or watch.get("interval", 1) <= 0:
+        errors.append("balance_watch.interval must be a number of seconds above 0")
+    if not isinstance(data.get("metrics", {}), dict) or not isinstance(data.get("metrics", {}).get("prometheus_file", ""), str):
+        errors.append("metrics must be an object with a prometheus_file path")
+
+    calls = data.get("exchange_calls", {})
+    if not isinstance(calls, dict) or not all(
+            key in call_policy and isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+            for key, value in calls.items()):
+        errors.append(f"exchange_calls must map {', '.join(call_policy)} to numbers of at least 0")
+
+    concurrency = data.get("order_concurrency", {})
+    if not isinstance(concurrency, dict) or not all(
+            isinstance(value, int) and not isinstance(value, bool) and value >= 1 for value in concurrency.values()):
+        errors.append("order_concurrency must map exchange names to whole numbers of at least 1")
+    return errors
+
+
+_loaded = None  # (mtime_ns, size, Config) of the last parse
+_lock = threading.Lock()
+
 
 def load_config():
-    """Load config from config.json"""
-    with open("config/config.json", "r") as file:
-        return json.load(file)
\ No newline at end of file
+    """Load config from config.json, parsed and validated once and again only when the file changes.
+    Raises ConfigError when the file is invalid so commands fail before any network work."""
+    global _loaded
+    try:
+        stat = os.stat(CONFIG_PATH)
+    except OSError as e:
+        raise ConfigError(f"Cannot read {CONFIG_PATH}: {e}")
+
+    with _lock:
+        if _loaded and _loaded[:2] == (stat.st_mtime_ns, stat.st_size):
+            return _loaded[2]
+
+        try:
+            with open(CONFIG_PATH, "r") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            raise ConfigError(f"Cannot parse {CONFIG_PATH}: {e}")
+
+        errors = validate(data)
+        if errors:
+            raise ConfigError(f"Invalid {CONFIG_PATH}:\n  " + "\n  ".join(errors))
+
+        _loaded = (stat.st_mtime_ns, stat.st_size, Config(data))
+        # Timeouts, retries and circuit breakers are applied inside the exchanges package
+        configure_calls(**data.get("exchange_calls", {}))
+        return _loaded[2]
@@ -0,0 +1,183 @@
+# daemon.py
+import contextvars
+import io
+import os
+import socket
+import socketserver
+import sys
+import threading
+from client import SOCKET_PATH, END
+from commands import execute_command, warm_start
+from config import load_config
+from exchanges import get_exchange
+from logger import get_logger
+from quantity import get_market_rules
+from utils import run_parallel
+
+logger = get_logger()
+
+# Commands run one at a time, in the order they arrive. Watches only read and run until their client leaves,
+# they run beside the other commands so a trade never waits behind one
+command_lock = threading.Lock()
+
+# The client stream of the command running in this context, inherited by the threads the command fans out to
+client_output = contextvars.ContextVar('client_output', default=None)
+
+
+class ContextOutput(io.TextIOBase):
+    """Installed as sys.stdout: writes go to the client of the command that is running, output of background
+    threads (warm-up, price feeds) stays in the daemon's own stdout instead of ending up in a client's output"""
+
+    def __init__(self, default):
+        self.default = default
+
+    def target(self):
+        return client_output.get() or self.default
+
+    @property
+    def connected(self):
+        return getattr(self.target(), 'connected', True)
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return self.target().isatty()
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+
+class SocketWriter(io.TextIOBase):
+    """Text stream that sends everything written to it to the client. If the client goes away the command
+    keeps running, its output is dropped, so a trade is never cut short by a closed terminal."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._connected = True
+
+    @property
+    def connected(self):
+        """False once the client closed its end, checked without waiting so long running commands can stop"""
+        if self._connected:
+            try:
+                if self.connection.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b'':
+                    self._connected = False
+            except BlockingIOError:
+                pass
+            except OSError:
+                self._connected = False
+        return self._connected
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if self._connected:
+            try:
+                self.connection.sendall(text.encode())
+            except OSError:
+                self._connected = False
+        return len(text)
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """Reads one command line, streams its output back and ends with END and the exit code"""
+
+    def handle(self):
+        command = self.rfile.readline().decode().strip()
+        if not command:
+            return
+        output = SocketWriter(self.connection)
+        if command == 'stop':
+            output.write("Daemon stopping.\n")
+            # shutdown waits for serve_forever to return, which cannot happen on this thread
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            status = 0
+        else:
+            token = client_output.set(output)
+            try:
+                if '--watch' in command.split():
+                    status = run(command)
+                else:
+                    with command_lock:
+                        status = run(command)
+            finally:
+                client_output.reset(token)
+        output.write(f"{END.decode()}{status}")
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def run(command):
+    """Run one command, returns its exit code, 1 when it or any part of it failed"""
+    try:
+        return 1 if execute_command(command) is False else 0
+    except Exception as e:
+        print(f"Error: {e}")
+        logger.error(f"Error running '{command}': {e}")
+        return 1
+
+
+def warm_account(exchange_name, account_name):
+    """Create the client and load the order size rules of the account's exchange, so trades start without setup"""
+    get_market_rules(get_exchange(exchange_name, account_name))
+
+
+def warm_up(config):
+    """Load clients and market rules of every account in the background, warm_start refreshes balances and prices"""
+    def load():
+        for (exchange_name, account_name), _, error in run_parallel(warm_account, config.pairs('all'), config.get('max_workers', 8)):
+            if error:
+                logger.error(f"Error warming up {exchange_name}_{account_name}: {error}")
+
+    threading.Thread(target=load, daemon=True).start()
+    warm_start()
+
+
+def remove_stale_socket(path):
+    """Remove the socket left behind by a daemon that did not exit cleanly, fail if one is still listening"""
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+            return
+    raise RuntimeError(f"A daemon is already listening on {path}")
+
+
+def serve(path=SOCKET_PATH):
+    """Keep clients, caches and price feeds warm and run the commands sent by client.py until stopped"""
+    config = load_config()
+    try:
+        remove_stale_socket(path)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    # Anyone who can connect can trade, so only the owner may connect. The socket is created with those
+    # permissions, a chmod after bind would leave it open to others until then
+    umask = os.umask(0o177)
+    try:
+        server = DaemonServer(path, CommandHandler)
+    finally:
+        os.umask(umask)
+    stdout = sys.stdout
+    sys.stdout = ContextOutput(stdout)
+    warm_up(config)
+    print(f"Daemon listening on {path}, send commands with: python3 client.py balance all")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nExiting...")
+    finally:
+        server.server_close()
+        os.unlink(path)
+        sys.stdout = stdout
+    return 0
@@ -1,14 +1,33 @@
 # exchanges/__init__.py
+import importlib
 import os
-from .binance import Binance
-from .kraken import Kraken
-from .bitfinex import Bitfinex
-from .coinbase import Coinbase
-#from .bitget import Bitget
-#from .kucoin import KuCoin
+import threading
+import time
+from .calls import call_policy, call_budget, configure_calls
+from .exchange_base import ExchangeBase
+from .errors import OrderRejected, CallTimeout, CircuitOpen
 from dotenv import load_dotenv
 
-load_dotenv()  # Load environment variables from the .env file
+load_dotenv()  # Load environment variables from the .env file, once for the whole app
+
+# Exchange adapters by name as (module, class), the module and its SDK are only imported
+# the first time an account on that exchange is used
+ADAPTERS = {
+    'binance': ('.binance', 'Binance'),
+    'kraken': ('.kraken', 'Kraken'),
+    'bitfinex': ('.bitfinex', 'Bitfinex'),
+    'coinbase': ('.coinbase', 'Coinbase'),
+    'bitget': ('.bitget', 'Bitget'),
+    'kucoin': ('.kucoin', 'KuCoin'),
+}
+_adapters = {}          # name -> loaded ExchangeBase subclass
+adapter_load_times = {} # name -> seconds spent importing the adapter module
+_adapter_lock = threading.Lock()
+
+# Process-wide registry of exchange clients, keyed by (exchange, account)
+_clients = {}
+_client_locks = {}
+_registry_lock = threading.Lock()
 
 def get_api_keys(exchange_name, account_name):
     """ Load the API key and secret from the .env file based on exchange and account name """
@@ -26,25 +45,69 @@ def get_api_keys(exchange_name, account_name):
         return api_key, api_secret, api_passphrase
     return api_key, api_secret
 
+def register_exchange(exchange_name, adapter):
+    """ Register an adapter under exchange_name, either a (module, class name) pair imported on first use or an ExchangeBase subclass """
+    name = exchange_name.lower()
+    with _adapter_lock:
+        _adapters.pop(name, None)
+        if isinstance(adapter, tuple):
+            ADAPTERS[name] = adapter
+        else:
+            ADAPTERS[name] = (adapter.__module__, adapter.__name__)
+            _adapters[name] = adapter
+
+def load_adapter(exchange_name):
+    """ Return the adapter class of the exchange, importing its module on first use """
+    name = exchange_name.lower()
+    adapter = _adapters.get(name)
+    if adapter is not None:
+        return adapter
+    if name not in ADAPTERS:
+        raise ValueError(f"Exchange {exchange_name} is not supported.")
+
+    with _adapter_lock:
+        adapter = _adapters.get(name)
+        if adapter is None:
+            module_name, class_name = ADAPTERS[name]
+            started = time.perf_counter()
+            module = importlib.import_module(module_name, __name__)
+            adapter_load_times[name] = time.perf_counter() - started
+            adapter = _adapters[name] = getattr(module, class_name)
+        return adapter
+
 def get_exchange(exchange_name, account_name):
-    """ Get an instance of the exchange class based on the exchange name and account name """
-    if exchange_name.lower() == 'binance':
-        api_key, api_secret = get_api_keys(exchange_name, account_name)
-        return Binance(account_name, exchange_name, api_key, api_secret)
-    elif exchange_name.lower() == 'kraken':
-        api_key, api_secret = get_api_keys(exchange_name, account_name)
-        return Kraken(account_name, exchange_name, api_key, api_secret)
-    elif exchange_name.lower() == 'bitfinex':
-        api_key, api_secret = get_api_keys(exchange_name, account_name)
-        return Bitfinex(account_name, exchange_name, api_key, api_secret)
-    elif exchange_name.lower() == 'coinbase':
-        api_key, api_secret = get_api_keys(exchange_name, account_name)
-        return Coinbase(account_name, exchange_name, api_key, api_secret)
-    elif exchange_name.lower() == 'bitget':
-        api_key, api_secret = get_api_keys(exchange_name, account_name)
-        return Bitget(account_name, exchange_name, api_key, api_secret)
-    elif exchange_name.lower() == 'kucoin':
+    """ Get the shared exchange instance for the exchange-account pair, creating it on first use """
+    key = (exchange_name.lower(), account_name.lower())
+    exchange = _clients.get(key)
+    if exchange is not None:
+        return exchange
+
+    # One lock per pair so different accounts can be constructed at the same time
+    with _registry_lock:
+        lock = _client_locks.setdefault(key, threading.Lock())
+    with lock:
+        exchange = _clients.get(key)
+        if exchange is None:
+            exchange = create_exchange(exchange_name, account_name)
+            _clients[key] = exchange
+        return exchange
+
+def invalidate_exchange(exchange_name=None, account_name=None):
+    """ Drop cached exchange instances so the next get_exchange rebuilds them with fresh credentials """
+    load_dotenv(override=True)
+    with _registry_lock:
+        for key in list(_clients):
+            if exchange_name and key[0] != exchange_name.lower():
+                continue
+            if account_name and key[1] != account_name.lower():
+                continue
+            del _clients[key]
+
+def create_exchange(exchange_name, account_name):
+    """ Create a new instance of the exchange class based on the exchange name and account name """
+    adapter = load_adapter(exchange_name)
+    if exchange_name.lower() == 'kucoin':
         api_key, api_secret, api_passphrase = get_api_keys(exchange_name, account_name)
-        return KuCoin(account_name, exchange_name, api_key, api_secret, api_passphrase)
-    else:
-        raise ValueError(f"Exchange {exchange_name} is not supported.")
+        return adapter(account_name, exchange_name, api_key, api_secret, api_passphrase)
+    api_key, api_secret = get_api_keys(exchange_name, account_name)
+    return adapter(account_name, exchange_name, api_key, api_secret)
@@ -1,16 +1,32 @@
 # exchanges/binance.py
 import os
 from binance.client import Client
-from .exchange_base import ExchangeBase
-from dotenv import load_dotenv
+from binance.exceptions import BinanceAPIException
+from .exchange_base import ExchangeBase, OrderRejected
 
-load_dotenv()
 
 class Binance(ExchangeBase):
     fiat = "USDC"
+
+    # 6000 request weight per minute per IP, 1000 kept spare as the exchange counts in fixed one minute windows,
+    # and 100 orders per 10 seconds per account, of which we use half
+    exchange_limit = (5000, 60)
+    key_limit = (50, 10)
+    call_costs = {
+        'get_balance': (20, 0),
+        'get_prices': (4, 0),
+        'get_markets': (20, 0),
+        'buy': (1, 1),
+        'sell': (1, 1),
+        'get_margin_balance': (10, 0),
+        'get_active_margin_loans': (10, 0),
+        'get_margin_snapshot': (10, 0),
+        'get_stream_token': (2, 0),
+        'keep_stream_alive': (2, 0),
+    }
     
     def __init__(self, account_name, exchange_name, api_key, api_secret):
-        super().__init__(account_name, exchange_name)
+        super().__init__(account_name, exchange_name, api_key)
 
         if os.getenv('EXCHANGE_SANDBOX', 'false').lower() == 'true':
             self.client = Client(api_key, api_secret, testnet=True)
@@ -18,6 +34,16 @@ class Binance(ExchangeBase):
             self.client = Client(api_key, api_secret)
         
 
+    def rate_usage(self):
+        """Read the used request weight and any ban or back-off from the last response headers."""
+        response = getattr(self.client, "response", None)
+        if response is None:
+            return None, None
+        used = response.headers.get("x-mbx-used-weight-1m")
+        # 429 asks us to back off, 418 means the IP is already banned, both say for how long
+        retry_after = response.headers.get("Retry-After") if response.status_code in (418, 429) else None
+        return (int(used) if used else None), (float(retry_after) if retry_after else None)
+
     def get_balance(self):
         """Get the balance of assets from the Binance account."""
         balance_data = self.client.get_account()["balances"]
@@ -28,67 +54,109 @@ class Binance(ExchangeBase):
         prices = self.client.get_all_tickers()
         return {price["symbol"]: float(price["price"]) for price in prices}
 
+    def get_markets(self):
+        """Get the spot markets listed on Binance."""
+        symbols = self.client.get_exchange_info()["symbols"]
+        markets = []
+        for market in symbols:
+            if market["status"] != "TRADING":
+                continue
+            filters = {f["filterType"]: f for f in market["filters"]}
+            lot_size = filters.get("LOT_SIZE", {})
+            # Newer symbols use NOTIONAL, older ones MIN_NOTIONAL
+            notional = filters.get("NOTIONAL") or filters.get("MIN_NOTIONAL") or {}
+            markets.append({
+                "symbol": market["symbol"],
+                "base": market["baseAsset"],
+                "quote": market["quoteAsset"],
+                "base_asset": market["baseAsset"],
+                "quote_asset": market["quoteAsset"],
+                "step": float(lot_size.get("stepSize", 0)) or None,
+                "min_qty": float(lot_size.get("minQty", 0)) or None,
+                "min_notional": float(notional.get("minNotional", 0)) or None,
+            })
+        return markets
+
     def buy(self, asset, amount):
         """Buy the asset with the given amount."""
         symbol = asset + self.fiat
         print(f"Sending buy order for {amount} of {asset} on Binance.")
-        res = self.client.order_market_buy(symbol=symbol, quantity=amount)
+        try:
+            res = self.client.order_market_buy(symbol=symbol, quantity=amount)
+        except BinanceAPIException as e:
+            raise OrderRejected(e.message) from e
         print(res)
         print(f"Placed buy order for {amount} of {asset} on Binance.")
+        return res
 
     def sell(self, asset, amount):
         """Sell the asset with the given amount."""
         symbol = asset + self.fiat
         print(f"Sending sell order for {amount} of {asset} on Binance.")
-        res = self.client.order_market_sell(symbol=symbol, quantity=amount)
+        try:
+            res = self.client.order_market_sell(symbol=symbol, quantity=amount)
+        except BinanceAPIException as e:
+            raise OrderRejected(e.message) from e
         print(res)
         print(f"Placed sell order for {amount} of {asset} on Binance.")
+        return res
     
+    def order_id(self, response):
+        """Binance answers orders with the order as a dict."""
+        return response.get("orderId") if isinstance(response, dict) else None
+
+    def get_stream_token(self):
+        """Create a listen key for the user data stream, valid for 60 minutes unless kept alive."""
+        return self.client.stream_get_listen_key()
+
+    def keep_stream_alive(self, listen_key):
+        """Extend the listen key of the user data stream by another 60 minutes."""
+        self.client.stream_keepalive(listen_key)
+
+    def get_margin_snapshot(self):
+        """Get margin balances and loans from a single margin account request."""
+        margin_info = self._get_margin_account()
+        return {'balances': self._margin_balances(margin_info), 'loans': self._margin_loans(margin_info)}
+
     def get_margin_balance(self):
         """Get the margin balance of the Binance account."""
-        try:
-            margin_info = self.client.get_margin_account()
-            #print("🔍 Debug - Margin Info:", margin_info)  # Debugging statement
-
-            #p = self.client.papi_get_balance()
-            #print("🔍 Debug - PAPI Balance:", p)  # Debugging statement
-            #pp = self.client.papi_get_account()
-            #print("🔍 Debug - PAPI Acc:", pp)
-
-            if not isinstance(margin_info, dict):
-                raise ValueError(f"Unexpected response type: {type(margin_info)}. Response: {margin_info}")
-
-            user_assets = margin_info.get('userAssets', [])
-
-            if not user_assets:
-                print("ℹ️ No margin assets found. Ensure margin trading is enabled and there are active margin positions.")
-
-            margin_balances = {
-                asset['asset']: {
-                    'borrowed': float(asset.get('borrowed', 0)),
-                    'free': float(asset.get('free', 0)),
-                    'total': float(asset.get('total', 0))
-                }
-                for asset in user_assets
-                if float(asset.get('borrowed', 0)) > 0 or float(asset.get('free', 0)) > 0
-            }
+        return self._margin_balances(self._get_margin_account())
 
-            return margin_balances
-        except Exception as e:
-            print(f"❌ Error fetching margin balance: {e}")
-            return {}
-    
     def get_active_margin_loans(self):
         """Fetch active margin loans by parsing the margin account."""
-        try:
-            margin_info = self.client.get_margin_account()
-            active_loans = {}
-            for asset in margin_info.get('userAssets', []):
-                borrowed = float(asset.get('borrowed', 0))
-                if borrowed > 0:
-                    active_loans[asset['asset']] = borrowed
-            #print("🔍 Debug - Active Margin Loans:", active_loans)  # Debugging statement
-            return active_loans
-        except Exception as e:
-            print(f"❌ Error fetching active margin loans: {e}")
-            return {}
\ No newline at end of file
+        return self._margin_loans(self._get_margin_account())
+
+    def _get_margin_account(self):
+        margin_info = self.client.get_margin_account()
+        #print("🔍 Debug - Margin Info:", margin_info)  # Debugging statement
+
+        #p = self.client.papi_get_balance()
+        #print("🔍 Debug - PAPI Balance:", p)  # Debugging statement
+        #pp = self.client.papi_get_account()
+        #print("🔍 Debug - PAPI Acc:", pp)
+
+        if not isinstance(margin_info, dict):
+            raise ValueError(f"Unexpected response type: {type(margin_info)}. Response: {margin_info}")
+        return margin_info
+
+    @staticmethod
+    def _margin_balances(margin_info):
+        return {
+            asset['asset']: {
+                'borrowed': float(asset.get('borrowed', 0)),
+                'free': float(asset.get('free', 0)),
+                'total': float(asset.get('total', 0))
+            }
+            for asset in margin_info.get('userAssets', [])
+            if float(asset.get('borrowed', 0)) > 0 or float(asset.get('free', 0)) > 0
+        }
+
+    @staticmethod
+    def _margin_loans(margin_info):
+        active_loans = {}
+        for asset in margin_info.get('userAssets', []):
+            borrowed = float(asset.get('borrowed', 0))
+            if borrowed > 0:
+                active_loans[asset['asset']] = borrowed
+        #print("🔍 Debug - Active Margin Loans:", active_loans)  # Debugging statement
+        return active_loans
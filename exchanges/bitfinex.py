@@ -1,12 +1,40 @@
+import hashlib
+import hmac
 import os
+import time
 import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from bfxapi import Client
-from .exchange_base import ExchangeBase
-from dotenv import load_dotenv
+from bfxapi.rest.exceptions import RequestParameterError, GenericError
+from .exchange_base import ExchangeBase, OrderRejected
+from cache import TTLCache, load_json
 
 class Bitfinex(ExchangeBase):
+    # Bitfinex names some assets differently from everyone else
+    aliases = {"UST": "USDT", "UDC": "USDC"}
+
+    # order multi-op takes up to 75 operations per request
+    batch_size = 75
+
+    prices_by_asset = True
+
+    # The pair list rarely changes, it is kept on disk and in memory and refreshed after this many seconds
+    pairs_refresh = 24 * 60 * 60
+    pair_list = TTLCache(ttl=pairs_refresh)
+
+    # REST endpoints allow 90 requests per minute per IP, tickers only 30, so they count three times
+    exchange_limit = (90, 60)
+    call_costs = {
+        'get_prices': (3, 0),
+        'get_markets': (2, 0),
+        'get_margin_snapshot': (2, 0),
+    }
+
     def __init__(self, account_name, exchange_name, api_key, api_secret):
-        super().__init__(account_name, exchange_name)
+        super().__init__(account_name, exchange_name, api_key)
+        # The private websocket signs its own authentication message
+        self.credentials = (api_key, api_secret)
         # Initialize the Bitfinex Client
         self.client = Client(
             api_key=api_key,
@@ -15,101 +43,200 @@ class Bitfinex(ExchangeBase):
 
     def get_balance(self):
         """Get the balance of assets from the Bitfinex account."""
-        try:
-            # Use authenticated request to fetch wallet balances
-            response = self.client.rest.auth.get_wallets()
-            return {
-                wallet.currency: float(wallet.balance)
-                for wallet in response if float(wallet.balance) > 0
-            }
-        except Exception as e:
-            print(f"Error fetching balances: {e}")
-            return {}
+        # Use authenticated request to fetch wallet balances
+        response = self.client.rest.auth.get_wallets()
+        return {
+            wallet.currency: float(wallet.balance)
+            for wallet in response if float(wallet.balance) > 0
+        }
 
-    def get_prices(self):
-        """Get the prices of all assets on Bitfinex."""
-        try:
-            # List of asset pairs we want to get prices for
-            symbols = [
-                'tBTCUSD', 'tETHUSD', 'tLTCUSD', 'tXRPUSD', 'tBCHUSD', 'tEOSUSD',
-                'tADAUSD', 'tTRXUSD', 'tDOTUSD', 'tUNIUSD', 'tSOLUSD', 'tIOTUSD', 'tBCHNUSD','tBCHUSD','BCHNUSD','BCHUSD', 'tXLMUSD'
-            ]
-
-            # Fetch tickers for the specified pairs
-            tickers = self.client.rest.public.get_tickers(symbols)
-            #print(tickers)
-            # Return a dictionary of symbol: last_price
-            p = {
-                symbol: float(ticker.last_price)  # Access 'last_price' from the 'TradingPairTicker' object
-                for symbol, ticker in tickers.items()  # Iterate through tickers dictionary
-            }
-            #print(p)
-            return p
+    def get_pairs(self):
+        """Get the exchange trading pairs (BTCUSD, TESTBTC:TESTUSD, ...), from the cache while it is fresh."""
+        fetch = lambda: self.client.rest.public.conf("pub:list:pair:exchange")
+        return Bitfinex.pair_list.get("pairs", lambda: load_json("bitfinex_pairs", self.pairs_refresh, fetch))
 
-        except Exception as e:
-            print(f"Error fetching prices: {e}")
+    def get_prices(self, assets=None):
+        """Get the prices of the USD/USDT pairs of the given wallet currencies, or of every USD/USDT pair on Bitfinex."""
+        # Resolve the currencies against the pair list
+        symbols = []
+        for pair in self.get_pairs():
+            base, quote = Bitfinex.split_pair(pair)
+            if quote in ("USD", "UST") and (assets is None or base in assets):
+                symbols.append(f"t{pair}")
+        if not symbols:
             return {}
 
+        # Fetch tickers for all the pairs in one request
+        tickers = self.client.rest.public.get_tickers(symbols)
+        #print(tickers)
+        # Return a dictionary of symbol: last_price
+        p = {
+            symbol: float(ticker.last_price)  # Access 'last_price' from the 'TradingPairTicker' object
+            for symbol, ticker in tickers.items()  # Iterate through tickers dictionary
+        }
+        #print(p)
+        return p
+
+    def get_markets(self):
+        """Get the spot markets listed on Bitfinex."""
+        pairs = self.get_pairs()
+        # [[pair, [_, _, _, min_order_size, max_order_size, ...]], ...]
+        min_sizes = {pair: info[3] for pair, info in self.client.rest.public.conf("pub:info:pair")}
+        markets = []
+        for pair in pairs:
+            base, quote = Bitfinex.split_pair(pair)
+            markets.append({
+                "symbol": f"t{pair}",
+                "base": base,
+                "quote": quote,
+                "base_asset": Bitfinex.aliases.get(base, base),
+                "quote_asset": Bitfinex.aliases.get(quote, quote),
+                # Bitfinex accepts amounts with up to 8 decimals
+                "step": 1e-8,
+                "min_qty": float(min_sizes.get(pair) or 0) or None,
+                "min_notional": None,
+            })
+        return markets
+
     def buy(self, asset, amount):
         """Buy the asset with the given amount."""
-        try:
-            symbol = f"t{asset.upper()}USD"  # Example: 'tBTCUSD'
-            # Place a buy order
-            print(f"Sending buy order for {amount} of {symbol} on Bitfinex.")
-            self.client.rest.auth.submit_order(symbol, 'buy', 'EXCHANGE MARKET', amount)
-            print(f"Placed buy order for {amount} of {asset} on Bitfinex.")
-        except Exception as e:
-            print(f"Error placing buy order: {e}")
+        symbol = f"t{asset.upper()}USD"  # Example: 'tBTCUSD'
+        print(f"Sending buy order for {amount} of {symbol} on Bitfinex.")
+        res = self._submit_market_order(symbol, amount)
+        print(f"Placed buy order for {amount} of {asset} on Bitfinex.")
+        return res
 
     def sell(self, asset, amount):
         """Sell the asset with the given amount."""
+        symbol = f"t{asset.upper()}USD"  # Example: 'tBTCUSD'
+        print(f"Sending sell order for {amount} of {symbol} on Bitfinex.")
+        # Bitfinex expresses sells as negative amounts
+        res = self._submit_market_order(symbol, -amount)
+        print(f"Placed sell order for {amount} of {asset} on Bitfinex.")
+        return res
+
+    def stream_auth(self):
+        """Build the signed authentication message of the private websocket, limited to wallet updates."""
+        api_key, api_secret = self.credentials
+        nonce = str(int(time.time() * 1000000))
+        payload = f"AUTH{nonce}"
+        signature = hmac.new(api_secret.encode(), payload.encode(), hashlib.sha384).hexdigest()
+        return {"event": "auth", "apiKey": api_key, "authSig": signature, "authPayload": payload,
+                "authNonce": nonce, "filter": ["wallet"]}
+
+    def order_id(self, response):
+        """Single orders answer with a notification of the order, batch entries are the raw order array [ID, GID, CID, ...]."""
+        if isinstance(response, list):
+            return response[0] if response else None
+        return getattr(getattr(response, "data", None), "id", None)
+
+    def submit_orders(self, orders, max_concurrency=1, deadline=None):
+        """Send the orders through the order multi-op endpoint, up to batch_size orders per request."""
+        for i in range(0, len(orders), self.batch_size):
+            chunk = orders[i:i + self.batch_size]
+            if deadline is not None and time.monotonic() > deadline:
+                self.mark_orders(chunk, 'unsent', 'deadline passed')
+            else:
+                self.send_batch(chunk)
+        return orders
+
+    def _submit_batch(self, orders):
+        """Send several exchange market orders in one order multi-op request."""
+        ops = [
+            ["on", {
+                "type": "EXCHANGE MARKET",
+                "symbol": f"t{order['asset'].upper()}USD",
+                # Bitfinex expresses sells as negative amounts
+                "amount": order['amount'] if order['side'] == 'buy' else -order['amount'],
+            }]
+            for order in orders
+        ]
+
+        print(f"Sending batch of {len(orders)} orders on Bitfinex.")
+        start = time.monotonic()
         try:
-            symbol = f"t{asset.upper()}USD"  # Example: 'tBTCUSD'
-            # Place a sell order
-            print(f"Sending sell order for {amount} of {symbol} on Bitfinex.")
-            self.client.rest.auth.submit_order(symbol, 'sell', 'EXCHANGE MARKET', amount)
-            print(f"Placed sell order for {amount} of {asset} on Bitfinex.")
+            # bfxapi has no wrapper for this endpoint, post it through its authenticated middleware
+            notification = self.client.rest.auth._m.post("auth/w/order/multi", body={"ops": ops})
+        except (RequestParameterError, GenericError) as e:
+            self.mark_orders(orders, 'rejected', str(e), time.monotonic() - start)
+            return
         except Exception as e:
-            print(f"Error placing sell order: {e}")
+            self.mark_orders(orders, 'error', str(e), time.monotonic() - start)
+            return
+        latency = time.monotonic() - start
 
-    def get_margin_balance(self):
-        """Get the margin balance of the Bitfinex account."""
+        # [MTS, TYPE, MESSAGE_ID, null, [op notification, ...], CODE, STATUS, TEXT]
+        # with each op notification [MTS, TYPE, MESSAGE_ID, null, ORDER, CODE, STATUS, TEXT]
+        results = notification[4] or []
+        for order, result in zip(orders, results):
+            if result[6] == "SUCCESS":
+                self.mark_orders([order], 'sent', '', latency)
+                order['response'] = result[4]
+            else:
+                self.mark_orders([order], 'rejected', result[7], latency)
+        self.mark_orders(orders[len(results):], 'error', 'no result returned for the order', latency)
+        print(f"Placed batch of {len(orders)} orders on Bitfinex.")
+
+    @staticmethod
+    def split_pair(pair):
+        """Split a pair into base and quote, pairs are BTCUSD, or TESTBTC:TESTUSD when a code is longer than 3 characters"""
+        return tuple(pair.split(":")) if ":" in pair else (pair[:3], pair[3:])
+
+    def _submit_market_order(self, symbol, amount):
+        """Submit an exchange market order, raising OrderRejected when Bitfinex refuses it."""
         try:
-            # Pass the coroutine itself to asyncio.run() without invoking it
-            margin_info = self.client.rest.auth.get_base_margin_info()
-            margin_balances = {
-                'margin_balance': margin_info.margin_balance,
-                'margin_net': margin_info.margin_net,
-                'margin_min': margin_info.margin_min,
-                'user_pl': margin_info.user_pl,
-                'user_swaps': margin_info.user_swaps
+            notification = self.client.rest.auth.submit_order('EXCHANGE MARKET', symbol, amount, None)
+        except (RequestParameterError, GenericError) as e:
+            raise OrderRejected(str(e)) from e
+        if notification.status != "SUCCESS":
+            raise OrderRejected(notification.text)
+        return notification
+
+    def get_margin_snapshot(self):
+        """Get margin info and positions with the two requests in flight at the same time."""
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            margin_info = pool.submit(contextvars.copy_context().run, self.client.rest.auth.get_base_margin_info)
+            positions = pool.submit(contextvars.copy_context().run, self.client.rest.auth.get_positions)
+            return {
+                'balances': self._margin_balances(margin_info.result()),
+                'loans': self._margin_loans(positions.result()),
             }
-            #print("🔍 Debug - Margin Info:", margin_balances)
-            return margin_balances
-        except Exception as e:
-            print(f"❌ Error fetching margin balance: {e}")
-            return {}
+
+    def get_margin_balance(self):
+        """Get the margin balance of the Bitfinex account."""
+        return self._margin_balances(self.client.rest.auth.get_base_margin_info())
 
     def get_active_margin_loans(self):
         """Fetch active margin loans with detailed information."""
-        try:
-            positions = self.client.rest.auth.get_positions()
-            active_loans_list = []
-            for pos in positions:
-                if pos.amount > 0:
-                    loan_info = {
-                        'symbol': pos.symbol.strip('t'),  # Removing 't' prefix for consistency
-                        'amount': float(pos.amount),
-                        'base_price': float(pos.base_price),
-                        'margin_funding': float(pos.margin_funding),
-                        'pl': float(pos.pl),
-                        'pl_perc': float(pos.pl_perc),
-                        'price_liq': float(pos.price_liq),
-                        'leverage': float(pos.leverage)
-                    }
-                    active_loans_list.append(loan_info)
-            #print("🔍 Debug - Active Margin Loans:", active_loans_list)
-            return active_loans_list
-        except Exception as e:
-            print(f"❌ Error fetching active margin loans: {e}")
-            return []
\ No newline at end of file
+        return self._margin_loans(self.client.rest.auth.get_positions())
+
+    @staticmethod
+    def _margin_balances(margin_info):
+        margin_balances = {
+            'margin_balance': margin_info.margin_balance,
+            'margin_net': margin_info.margin_net,
+            'margin_min': margin_info.margin_min,
+            'user_pl': margin_info.user_pl,
+            'user_swaps': margin_info.user_swaps
+        }
+        #print("🔍 Debug - Margin Info:", margin_balances)
+        return margin_balances
+
+    @staticmethod
+    def _margin_loans(positions):
+        active_loans_list = []
+        for pos in positions:
+            if pos.amount > 0:
+                loan_info = {
+                    'symbol': pos.symbol.strip('t'),  # Removing 't' prefix for consistency
+                    'amount': float(pos.amount),
+                    'base_price': float(pos.base_price),
+                    'margin_funding': float(pos.margin_funding),
+                    'pl': float(pos.pl),
+                    'pl_perc': float(pos.pl_perc),
+                    'price_liq': float(pos.price_liq),
+                    'leverage': float(pos.leverage)
+                }
+                active_loans_list.append(loan_info)
+        #print("🔍 Debug - Active Margin Loans:", active_loans_list)
+        return active_loans_list
@@ -0,0 +1,156 @@
+# exchanges/calls.py
+import contextvars
+import functools
+import random
+import threading
+import time
+from metrics import metrics
+from .errors import OrderRejected, CallTimeout, CircuitOpen
+from .ratelimit import CALL_PRIORITY, ORDER, throttle, record_usage
+
+# Reads are safe to repeat, orders are never retried as the first one may have gone through
+IDEMPOTENT_CALLS = {name for name, priority in CALL_PRIORITY.items() if priority != ORDER}
+
+# Defaults, replaced by the exchange_calls section of config.json through configure_calls:
+# timeout seconds per attempt, retries of failed reads, backoff seconds before the first retry (doubled each time),
+# failures in a row that open an account's circuit and cooldown seconds before it is tried again
+call_policy = {'timeout': 10, 'retries': 2, 'backoff': 0.5, 'failures': 3, 'cooldown': 60}
+
+
+def configure_calls(**settings):
+    call_policy.update(settings)
+
+
+def call_budget(calls=1):
+    """Seconds calls guarded reads made one after the other can take at worst: every attempt timing out
+    and the longest jittered backoff before each retry. Time waiting for the rate limit is not included."""
+    retries = call_policy['retries']
+    backoff = call_policy['backoff'] * (2 ** retries - 1) * 1.5
+    return calls * ((1 + retries) * call_policy['timeout'] + backoff)
+
+
+class CircuitBreaker:
+    """Counts consecutive failures of one exchange account. Once open, calls fail right away until the cooldown
+    has passed, then a single trial call decides whether it closes again or stays open for another cooldown."""
+
+    def __init__(self, name):
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    def before(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + call_policy['cooldown'] - time.monotonic()
+            if remaining > 0 or self.trial:
+                raise CircuitOpen(f"{self.name} skipped after {self.failures} failures in a row, "
+                                  f"next try in {max(remaining, 0):.0f}s")
+            self.trial = True
+
+    def success(self):
+        with self._lock:
+            self.failures, self.opened_at, self.trial = 0, None, False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial = False
+            if self.failures >= call_policy['failures']:
+                self.opened_at = time.monotonic()
+
+
+# Process-wide breakers keyed by (exchange, account)
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(exchange_name, account_name):
+    key = (exchange_name, account_name)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(key, CircuitBreaker(f"{exchange_name}_{account_name}"))
+    return breaker
+
+
+def call_with_timeout(func, timeout):
+    """Run func, raising CallTimeout when it has not returned within timeout seconds.
+    The SDKs cannot be interrupted, so a call that times out finishes in its own thread and its result is dropped."""
+    if not timeout:
+        return func()
+    result = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            result['value'] = func()
+        except BaseException as e:
+            result['error'] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+    if not done.wait(timeout):
+        raise CallTimeout(f"no answer within {timeout}s")
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+
+def guarded(name, method):
+    """Wrap an exchange call with the account's circuit breaker, a timeout per attempt, jittered retries for reads
+    and the rate limit scheduler"""
+    retry = name in IDEMPOTENT_CALLS
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        breaker = get_breaker(self.exchange_name, self.account_name)
+        try:
+            breaker.before()
+        except CircuitOpen:
+            metrics.count('circuit_open', self.exchange_name, self.account_name)
+            raise
+        with metrics.span(name, self.exchange_name, self.account_name):
+            return call(self, breaker, *args, **kwargs)
+
+    def call(self, breaker, *args, **kwargs):
+        def attempt():
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                record_usage(self)
+
+        attempts = 1 + (call_policy['retries'] if retry else 0)
+        for number in range(attempts):
+            # Time spent waiting for the rate limit does not count against the timeout
+            with metrics.span('rate_limit_wait', self.exchange_name, self.account_name):
+                throttle(self, name)
+            try:
+                result = call_with_timeout(attempt, call_policy['timeout'])
+            except OrderRejected:
+                # The exchange answered, it is up
+                breaker.success()
+                raise
+            except CallTimeout as e:
+                metrics.count('timeout', self.exchange_name, self.account_name)
+                if number + 1 < attempts:
+                    continue
+                breaker.failure()
+                if not retry:
+                    raise CallTimeout(f"{e}, the order may still have been placed") from e
+                raise
+            except Exception:
+                if number + 1 == attempts:
+                    breaker.failure()
+                    raise
+                metrics.count('retry', self.exchange_name, self.account_name)
+                time.sleep(call_policy['backoff'] * 2 ** number * random.uniform(0.5, 1.5))
+            else:
+                breaker.success()
+                return result
+
+    wrapper.guarded = True
+    return wrapper
@@ -1,61 +1,116 @@
+import uuid
 from coinbase.rest import RESTClient
-from .exchange_base import ExchangeBase
+from .exchange_base import ExchangeBase, OrderRejected
+from cache import TTLCache, load_json
 
 class Coinbase(ExchangeBase):
+    prices_by_asset = True
+
+    # The product list rarely changes, it is kept on disk and in memory and refreshed after this many seconds
+    products_refresh = 24 * 60 * 60
+    product_list = TTLCache(ttl=products_refresh)
+
+    # Accounts per get_accounts page, the api maximum
+    accounts_page_size = 250
+
+    # Advanced Trade allows 30 private requests per second per API key
+    key_limit = (30, 1)
+
     def __init__(self, account_name, exchange_name, api_key, api_secret):
-        super().__init__(account_name, exchange_name)
+        super().__init__(account_name, exchange_name, api_key)
 
         self.client = RESTClient(api_key, api_secret)
 
     def get_balance(self):
         """Get the balance of assets from the Coinbase account."""
-        try:
-            accounts = self.client.get_accounts()
-            balances = {}
+        balances = {}
+        cursor = None
+        while True:
+            accounts = self.client.get_accounts(limit=self.accounts_page_size, cursor=cursor)
             for account in accounts['accounts']:
                 currency = account['currency']
                 amount = float(account['available_balance']['value'])
-                balances[currency] = amount
-            return balances
-        except Exception as e:
-            print(f"Error fetching balance: {e}")
-            return {}
+                # Coinbase lists an account for every currency, only keep the held ones
+                if amount > 0:
+                    balances[currency] = amount
+            if not accounts['has_next']:
+                return balances
+            cursor = accounts['cursor']
+
+    def get_product_ids(self):
+        """Get the ids of the spot products (BTC-USD, ...), from the cache while it is fresh."""
+        fetch = lambda: [product["product_id"] for product in self.client.get_products(product_type="SPOT")["products"]]
+        return Coinbase.product_list.get("products", lambda: load_json("coinbase_products", self.products_refresh, fetch))
 
-    def get_prices(self):
-        """Get the spot prices of all currency pairs."""
-        try:
-            products = self.client.get_products()
-            #print(products)
-            prices = {}
-            for product in products['products']:
-                if product['price']:
-                    prices[product['product_id']] = float(product['price'])
-
-            return prices
-        except Exception as e:
-            print(f"Error fetching prices: {e}")
+    def get_prices(self, assets=None):
+        """Get the prices of the -USD products of the given currencies, or the spot prices of all currency pairs."""
+        if assets is not None:
+            return self._get_best_bid_ask_prices(assets)
+        products = self.client.get_products()
+        #print(products)
+        prices = {}
+        for product in products['products']:
+            if product['price']:
+                prices[product['product_id']] = float(product['price'])
+
+        return prices
+
+    def _get_best_bid_ask_prices(self, assets):
+        """Get mid prices of the held currencies' -USD products in one best bid/ask request."""
+        products = set(self.get_product_ids())
+        product_ids = [f"{asset}-USD" for asset in assets if f"{asset}-USD" in products]
+        if not product_ids:
             return {}
 
+        response = self.client.get_best_bid_ask(product_ids=product_ids)
+        prices = {}
+        for book in response['pricebooks'] or []:
+            quotes = [float(level['price']) for level in (book['bids'] or [])[:1] + (book['asks'] or [])[:1]]
+            if quotes:
+                prices[book['product_id']] = sum(quotes) / len(quotes)
+        return prices
+
+    def get_markets(self):
+        """Get the spot markets listed on Coinbase."""
+        products = self.client.get_products(product_type="SPOT")
+        return [
+            {
+                "symbol": product["product_id"],
+                "base": product["base_currency_id"],
+                "quote": product["quote_currency_id"],
+                "base_asset": product["base_currency_id"],
+                "quote_asset": product["quote_currency_id"],
+                "step": float(product["base_increment"] or 0) or None,
+                "min_qty": float(product["base_min_size"] or 0) or None,
+                "min_notional": float(product["quote_min_size"] or 0) or None,
+            }
+            for product in products["products"]
+        ]
+
     def buy(self, asset, amount):
         """Buy the asset with the given amount using a market order."""
-        try:
-            product_id = f"{asset}-USD"
-            print(f"Sending buy order for {amount} of {product_id} on Coinbase.")
-            response = self.client.market_order_buy(client_order_id="", product_id=product_id, base_size=str(amount))
-            print(f"Buy order placed: {response}")
-            return response
-        except Exception as e:
-            print(f"Error placing buy order: {e}")
-            return {}
+        product_id = f"{asset}-USD"
+        print(f"Sending buy order for {amount} of {product_id} on Coinbase.")
+        # Every order needs its own client_order_id, Coinbase dedupes on it
+        response = self.client.market_order_buy(client_order_id=str(uuid.uuid4()), product_id=product_id, base_size=str(amount))
+        if not response.success:
+            raise OrderRejected(str(getattr(response, "error_response", response)))
+        print(f"Buy order placed: {response}")
+        return response
+
+    def order_id(self, response):
+        """Placed orders carry their id in success_response."""
+        success = getattr(response, "success_response", None)
+        if isinstance(success, dict):
+            return success.get("order_id")
+        return getattr(success, "order_id", None)
 
     def sell(self, asset, amount):
         """Sell the asset with the given amount using a market order."""
-        try:
-            product_id = f"{asset}-USD"
-            print(f"Sending sell order for {amount} of {product_id} on Coinbase.")
-            response = self.client.market_order_sell(client_order_id="", product_id=product_id, base_size=str(amount))
-            print(f"Sell order placed: {response}")
-            return response
-        except Exception as e:
-            print(f"Error placing sell order: {e}")
-            return {}
\ No newline at end of file
+        product_id = f"{asset}-USD"
+        print(f"Sending sell order for {amount} of {product_id} on Coinbase.")
+        response = self.client.market_order_sell(client_order_id=str(uuid.uuid4()), product_id=product_id, base_size=str(amount))
+        if not response.success:
+            raise OrderRejected(str(getattr(response, "error_response", response)))
+        print(f"Sell order placed: {response}")
+        return response
\ No newline at end of file
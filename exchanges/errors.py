@@ -0,0 +1,13 @@
+# exchanges/errors.py
+
+class OrderRejected(Exception):
+    """Raised when the exchange answered an order request with a rejection."""
+    pass
+
+class CallTimeout(Exception):
+    """Raised when an exchange call did not answer within the configured timeout."""
+    pass
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an exchange account that failed repeatedly, until its cooldown has passed."""
+    pass
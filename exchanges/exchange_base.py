@@ -1,9 +1,44 @@
+import contextvars
+import queue
+import threading
+import time
 from abc import ABC, abstractmethod
+from .calls import guarded
+from .errors import OrderRejected, CallTimeout, CircuitOpen
+from .ratelimit import CALL_PRIORITY
 
 class ExchangeBase(ABC):
-    def __init__(self, account_name, exchange_name):
+    # Quote asset buy/sell orders are placed against
+    fiat = "USD"
+
+    # Set when get_prices(assets) can limit the fetch to the prices needed to value those balance codes
+    prices_by_asset = False
+
+    # Request limits as (capacity, seconds): exchange_limit is shared by every account (IP limits),
+    # key_limit applies per API key. None leaves the calls unthrottled.
+    exchange_limit = None
+    key_limit = None
+    # Cost of each call against (exchange_limit, key_limit), calls not listed cost one of each
+    call_costs = {}
+
+    def __init__(self, account_name, exchange_name, api_key=None):
         self.account_name = account_name
         self.exchange_name = exchange_name
+        # Accounts sharing an API key share its rate limit
+        self.rate_key = api_key or account_name
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Every exchange call goes through the circuit breaker, retries, timeout and rate limit scheduler, see calls.py
+        for name in CALL_PRIORITY:
+            method = cls.__dict__.get(name)
+            if callable(method) and not getattr(method, 'guarded', False):
+                setattr(cls, name, guarded(name, method))
+
+    def rate_usage(self):
+        """Return (used, retry_after) as reported by the exchange on the last response: the exchange_limit units
+        already used in the current window and the seconds to back off for, each None when not reported."""
+        return None, None
 
     @abstractmethod
     def get_balance(self):
@@ -15,12 +50,97 @@ class ExchangeBase(ABC):
         """Retrieve the prices of assets on the exchange."""
         pass
 
+    def get_markets(self):
+        """Retrieve the spot markets as dicts with symbol (as used by get_prices), base and quote
+        (codes as used by get_balance) and base_asset and quote_asset (canonical names, eg: BTC).
+        An optional base_codes list holds other balance codes of the base asset.
+        step, min_qty and min_notional hold the order size rules of the market, None when not limited."""
+        return []
+
     @abstractmethod
     def buy(self, asset, amount):
-        """Execute a buy order for the asset."""
+        """Execute a buy order for the asset, return the exchange response or raise OrderRejected."""
         pass
 
     @abstractmethod
     def sell(self, asset, amount):
-        """Execute a sell order for the asset."""
+        """Execute a sell order for the asset, return the exchange response or raise OrderRejected."""
         pass
+
+    def get_margin_snapshot(self):
+        """Retrieve the margin account state as a dict with balances (as get_margin_balance returns them) and
+        loans (as get_active_margin_loans), None when the exchange has no margin account.
+        Exchanges that get both from the same response override this to fetch it once."""
+        if not hasattr(self, 'get_margin_balance') and not hasattr(self, 'get_active_margin_loans'):
+            return None
+        return {
+            'balances': self.get_margin_balance() if hasattr(self, 'get_margin_balance') else None,
+            'loans': self.get_active_margin_loans() if hasattr(self, 'get_active_margin_loans') else None,
+        }
+
+    def order_id(self, response):
+        """Return the exchange's id of the order placed with response, as returned by buy/sell or set by a batch."""
+        return None
+
+    def submit_order(self, order):
+        """Send a single order record (side, asset, amount) and record its status, detail, response and latency."""
+        start = time.monotonic()
+        try:
+            if order['side'] == 'buy':
+                order['response'] = self.buy(order['asset'], order['amount'])
+            else:
+                order['response'] = self.sell(order['asset'], order['amount'])
+            order['status'] = 'sent'
+        except OrderRejected as e:
+            order['status'], order['detail'] = 'rejected', str(e)
+        except CircuitOpen as e:
+            # Skipped without a request, the order was never sent
+            order['status'], order['detail'] = 'unsent', str(e)
+        except Exception as e:
+            order['status'], order['detail'] = 'error', str(e)
+        finally:
+            order['latency'] = time.monotonic() - start
+        return order
+
+    def submit_orders(self, orders, max_concurrency=1, deadline=None):
+        """Send a list of order records, with up to max_concurrency single order requests in flight.
+        Exchanges with a native batch endpoint override this to send several orders per request.
+        Orders not started before deadline (a time.monotonic() value) are marked unsent instead of sent late."""
+        pending = queue.SimpleQueue()
+        for order in orders:
+            pending.put(order)
+
+        def worker():
+            while True:
+                try:
+                    order = pending.get_nowait()
+                except queue.Empty:
+                    return
+                if deadline is not None and time.monotonic() > deadline:
+                    self.mark_orders([order], 'unsent', 'deadline passed')
+                    continue
+                self.submit_order(order)
+
+        workers = [threading.Thread(target=contextvars.copy_context().run, args=(worker,), daemon=True)
+                   for _ in range(max(1, min(max_concurrency, len(orders))))]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return orders
+
+    def send_batch(self, orders, *args):
+        """Call _submit_batch(*args, orders) and record an outcome on the orders when the call wrapper gives up on it:
+        unsent when the account's circuit is open, error on a timeout as the exchange may still have placed them."""
+        try:
+            self._submit_batch(*args, orders)
+        except CircuitOpen as e:
+            self.mark_orders(orders, 'unsent', str(e))
+        except CallTimeout as e:
+            self.mark_orders(orders, 'error', str(e))
+
+    @staticmethod
+    def mark_orders(orders, status, detail='', latency=None):
+        """Record the same outcome on several order records, eg: all orders of a failed batch request."""
+        for order in orders:
+            order['status'], order['detail'], order['latency'] = status, detail, latency
@@ -1,12 +1,68 @@
 import os
+import threading
+import time
 from krakenex import API
-from .exchange_base import ExchangeBase
-from dotenv import load_dotenv
+from .exchange_base import ExchangeBase, OrderRejected
+from cache import TTLCache, load_json
+
+class KeyAPI(API):
+    """krakenex client whose private calls go out one at a time per API key, with strictly increasing nonces.
+    Kraken rejects a nonce not above the last one it saw for the key (EAPI:Invalid nonce), the millisecond clock
+    krakenex uses repeats between calls made at once, and calls made at once can arrive out of order."""
+
+    # Process-wide, accounts and clients sharing a key share its nonce
+    _locks = {}
+    _last_nonce = {}
+    _locks_lock = threading.Lock()
+
+    def query_private(self, method, data=None, timeout=None):
+        with KeyAPI._locks_lock:
+            lock = KeyAPI._locks.setdefault(self.key, threading.Lock())
+        with lock:
+            return super().query_private(method, data, timeout)
+
+    def _nonce(self):
+        # Called by query_private with the key's lock held
+        nonce = max(int(1000 * time.time()), KeyAPI._last_nonce.get(self.key, 0) + 1)
+        KeyAPI._last_nonce[self.key] = nonce
+        return nonce
+
 
 class Kraken(ExchangeBase):
+    # Kraken names some assets differently from everyone else
+    aliases = {"XBT": "BTC", "XDG": "DOGE"}
+
+    # to handle kraken code inconsistency
+    code_names = { "XXBT": "XBT", "XETH": "ETH", "XLTC": "LTC",
+        "XXDG": "XDG", "XXMR": "XMR", "XXRP": "XRP", "ZUSD": "USDT",
+        "XREP": "XREPZ", "XXLM": "XXLMZ", "XZEC": "XZECZ" }
+    idiotic_codes = {"XXLMZ": "XXLM", "XZECZ": "XZEC", "XREPZ": "XREP"}
+
+    prices_by_asset = True
+
+    # AssetPairs rarely changes, it is kept on disk and in memory and refreshed after this many seconds
+    pairs_refresh = 24 * 60 * 60
+    asset_pairs = TTLCache(ttl=pairs_refresh)
+
+    # Pairs per Ticker request
+    ticker_chunk = 50
+
+    # Public calls are limited to about one per second per IP. Private calls add to a counter per API key
+    # that allows 15 and decays by 0.33 per second. Orders are limited by the matching engine, not the counter.
+    exchange_limit = (1, 1)
+    key_limit = (15, 45)
+    call_costs = {
+        'get_balance': (0, 1),
+        'get_prices': (1, 0),
+        'get_markets': (1, 0),
+        'buy': (0, 0),
+        'sell': (0, 0),
+        'get_stream_token': (0, 1),
+    }
+
     def __init__(self, account_name, exchange_name, api_key, api_secret):
-        super().__init__(account_name, exchange_name)
-        self.api = API()
+        super().__init__(account_name, exchange_name, api_key)
+        self.api = KeyAPI()
 
         # Set API keys directly
         self.api.key = api_key
@@ -23,18 +79,32 @@ class Kraken(ExchangeBase):
 
         return {asset: float(amount) for asset, amount in balance_data.items() if float(amount) > 0}
 
-    def get_prices(self):
-        """Get the prices of all available trading pairs on Kraken."""
-        # Fetch all available trading pairs from Kraken
-        pairs_data = self.api.query_public("AssetPairs")["result"]
-        
-        # Extract the trading pairs from the response
-        pairs = [pair for pair in pairs_data.keys()]
-        #print(pairs)
+    def get_asset_pairs(self):
+        """Get the AssetPairs catalogue, from the cache while it is fresh."""
+        fetch = lambda: self.api.query_public("AssetPairs")["result"]
+        return Kraken.asset_pairs.get("AssetPairs", lambda: load_json("kraken_asset_pairs", self.pairs_refresh, fetch))
+
+    def get_prices(self, assets=None):
+        """Get the prices of the USD/USDT pairs of the given balance codes, or of all trading pairs on Kraken."""
+        pairs_data = self.get_asset_pairs()
+
+        if assets is None:
+            pairs = list(pairs_data)
+        else:
+            # Staked balances like XBT.F are priced by their base asset
+            codes = {asset.split(".")[0] for asset in assets}
+            pairs = [
+                pair for pair, info in pairs_data.items()
+                if info.get("quote") in ("ZUSD", "USDT")
+                and (info.get("base") in codes or info.get("wsname", "/").split("/")[0] in codes)
+            ]
+
+        # Fetch prices in chunks to keep each request small
+        ticker_data = {}
+        for i in range(0, len(pairs), self.ticker_chunk):
+            chunk = pairs[i:i + self.ticker_chunk]
+            ticker_data.update(self.api.query_public("Ticker", {"pair": ",".join(chunk)})["result"])
 
-        # Fetch prices for all pairs in one request
-        ticker_data = self.api.query_public("Ticker", {"pair": ",".join(pairs)})["result"]
-        
         prices = {}
         
         # Extract the last trade price for each pair
@@ -47,6 +117,29 @@ class Kraken(ExchangeBase):
 
         return prices
 
+    def get_markets(self):
+        """Get the spot markets listed on Kraken."""
+        pairs_data = self.get_asset_pairs()
+        markets = []
+        for pair, info in pairs_data.items():
+            # wsname carries the readable names, eg: XBT/USD for XXBTZUSD
+            if "wsname" not in info:
+                continue
+            base_name, quote_name = info["wsname"].split("/")
+            markets.append({
+                "symbol": pair,
+                "base": info["base"],
+                "quote": info["quote"],
+                # Staked balances use the short name, eg: XBT.F
+                "base_codes": [base_name],
+                "base_asset": Kraken.aliases.get(base_name, base_name),
+                "quote_asset": Kraken.aliases.get(quote_name, quote_name),
+                "step": 10 ** -info["lot_decimals"] if "lot_decimals" in info else None,
+                "min_qty": float(info.get("ordermin", 0)) or None,
+                "min_notional": float(info.get("costmin", 0)) or None,
+            })
+        return markets
+
     def buy(self, asset, amount):
         """Buy the asset with the given amount."""
         asset = Kraken.replace_code(asset)
@@ -59,29 +152,39 @@ class Kraken(ExchangeBase):
             "volume": amount
         })
         print(res)
+        if res.get("error"):
+            raise OrderRejected(", ".join(res["error"]))
         print(f"Placed buy order for {amount} of {asset} on Kraken.")
+        return res
 
     def sell(self, asset, amount):
         """Sell the asset with the given amount."""
         asset = Kraken.replace_code(asset)
-        res = pair = asset + "USD"
+        pair = asset + "USD"
         print(f"Sending sell order for {amount} of {pair} on Kraken.")
-        self.api.query_private("AddOrder", {
+        res = self.api.query_private("AddOrder", {
             "pair": pair,
             "type": "sell",
             "ordertype": "market",
             "volume": amount
         })
         print(res)
+        if res.get("error"):
+            raise OrderRejected(", ".join(res["error"]))
         print(f"Placed sell order for {amount} of {asset} on Kraken.")
+        return res
+
+    def get_stream_token(self):
+        """Get the token that authenticates private websocket subscriptions, it must be used within 15 minutes."""
+        return self.api.query_private("GetWebSocketsToken")["result"]["token"]
+
+    def order_id(self, response):
+        """AddOrder answers with {"result": {"txid": [...]}}."""
+        txid = response.get("result", {}).get("txid") if isinstance(response, dict) else None
+        return ",".join(txid) if isinstance(txid, list) else txid
 
     @staticmethod
     def replace_code(asset, flag = False):
-        # to handle kraken code inconsistency
-        code_names = { "XXBT": "XBT", "XETH": "ETH", "XLTC": "LTC",  
-            "XXDG": "XDG", "XXMR": "XMR", "XXRP": "XRP", "ZUSD": "USDT",
-            "XREP": "XREPZ", "XXLM": "XXLMZ", "XZEC": "XZECZ" }
-        if flag: 
-            idiotic_codes = {"XXLMZ": "XXLM", "XZECZ": "XZEC", "XREPZ": "XREP"}
-            code_names = {**code_names, **idiotic_codes}
-        return code_names.get(asset, asset)
\ No newline at end of file
+        if flag and asset in Kraken.idiotic_codes:
+            return Kraken.idiotic_codes[asset]
+        return Kraken.code_names.get(asset, asset)
\ No newline at end of file
@@ -1,9 +1,7 @@
 import os
 from kucoin.client import Client
 from .exchange_base import ExchangeBase
-from dotenv import load_dotenv
 
-load_dotenv()  # Load environment variables from the .env file
 
 class KuCoin(ExchangeBase):
     def __init__(self, account_name, exchange_name, api_key, api_secret, api_passphrase):
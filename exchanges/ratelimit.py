@@ -0,0 +1,113 @@
+# exchanges/ratelimit.py
+import heapq
+import itertools
+import threading
+import time
+
+# Call priorities, lower goes first when several calls wait on the same bucket
+ORDER, READ, INFO = 0, 1, 2
+
+# The ExchangeBase calls that go through the scheduler and their priority
+CALL_PRIORITY = {
+    'buy': ORDER,
+    'sell': ORDER,
+    '_submit_batch': ORDER,
+    'get_balance': READ,
+    'get_markets': READ,
+    'get_prices': INFO,
+    'get_margin_balance': INFO,
+    'get_active_margin_loans': INFO,
+    'get_margin_snapshot': INFO,
+    'get_stream_token': READ,
+    'keep_stream_alive': INFO,
+}
+
+
+class TokenBucket:
+    """Allows capacity units of cost per seconds, refilled continuously.
+    Waiting calls are served by priority, then in arrival order, so an order never queues behind a price fetch."""
+
+    def __init__(self, capacity, seconds):
+        self.capacity = capacity
+        self.rate = capacity / seconds
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self._waiters = []  # heap of (priority, arrival) tickets
+        self._arrivals = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cost=1, priority=READ):
+        """Block until cost units are available and this call is first in line, then take them"""
+        cost = min(cost, self.capacity)
+        with self._cond:
+            ticket = (priority, next(self._arrivals))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] != ticket:
+                        self._cond.wait()
+                        continue
+                    if now >= self.blocked_until and self.tokens >= cost:
+                        self.tokens -= cost
+                        return
+                    self._cond.wait(max(self.blocked_until - now, (cost - self.tokens) / self.rate))
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def observe(self, used):
+        """Sync with the usage the exchange reports for the current window, the bucket never holds more than what is left"""
+        with self._cond:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, self.capacity - used)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for seconds, eg: after a 429 with Retry-After"""
+        with self._cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = min(self.tokens, 0)
+            self._cond.notify_all()
+
+
+# Process-wide buckets, keyed by exchange for IP limits and by (exchange, api key) for key limits
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(key, limit):
+    """Return the shared bucket for key, created with limit (capacity, seconds) on first use"""
+    bucket = _buckets.get(key)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.setdefault(key, TokenBucket(*limit))
+    return bucket
+
+
+def throttle(exchange, name):
+    """Wait until the exchange's buckets allow the call, orders are let through first"""
+    exchange_cost, key_cost = exchange.call_costs.get(name, (1, 1))
+    priority = CALL_PRIORITY.get(name, READ)
+    if exchange.exchange_limit and exchange_cost:
+        get_bucket(exchange.exchange_name, exchange.exchange_limit).acquire(exchange_cost, priority)
+    if exchange.key_limit and key_cost:
+        get_bucket((exchange.exchange_name, exchange.rate_key), exchange.key_limit).acquire(key_cost, priority)
+
+
+def record_usage(exchange):
+    """Feed the usage the exchange reported on its last response back into its bucket"""
+    if not exchange.exchange_limit:
+        return
+    used, retry_after = exchange.rate_usage()
+    bucket = get_bucket(exchange.exchange_name, exchange.exchange_limit)
+    if used is not None:
+        bucket.observe(used)
+    if retry_after:
+        bucket.pause(retry_after)
@@ -0,0 +1,66 @@
+# executor.py
+from logger import get_logger, journal_order
+
+logger = get_logger()
+
+
+def new_order(exchange_name, account_name, side, asset, amount):
+    """Build an order record, status and detail are filled in once it is dispatched"""
+    return {
+        'exchange': exchange_name,
+        'account': account_name,
+        'side': side,
+        'asset': asset,
+        'amount': amount,
+        'status': 'pending',  # pending -> sent | rejected | error | unsent | simulated, or skipped before dispatch
+        'detail': '',
+        'latency': None,
+    }
+
+
+def dispatch_orders(exchange, orders, max_concurrency, live, deadline=None):
+    """Hand the pending orders of one exchange-account to exchange.submit_orders, or only print them if live is False.
+    Orders not started before deadline (a time.monotonic() value) are marked unsent instead of sent late."""
+    pending = [order for order in orders if order['status'] == 'pending']
+    label = f"{exchange.exchange_name}_{exchange.account_name}"
+
+    try:
+        if not live:
+            for order in pending:
+                print(f"[Simulation] {order['side'].capitalize()} {order['amount']} of {order['asset']} on {label}")
+                order['status'] = 'simulated'
+        elif pending:
+            exchange.submit_orders(pending, max_concurrency, deadline)
+    finally:
+        # Logged and journaled even when submit_orders raised, with whatever outcome each order got
+        for order in pending:
+            if order['status'] == 'sent':
+                logger.info(f"{order['side'].capitalize()} {order['amount']} of {order['asset']} on {label}")
+            elif order['status'] in ['rejected', 'error']:
+                logger.error(f"{order['status'].capitalize()} {order['side']} {order['amount']} of {order['asset']} on {label}: {order['detail']}")
+        # Every order of the command goes in the journal, skipped and simulated ones too
+        for order in orders:
+            journal_order(order, exchange)
+    return orders
+
+
+def print_order_summary(orders):
+    """Print one table with the outcome of every order of a trade command"""
+    if not orders:
+        print("No orders to send.")
+        return
+
+    print("\nOrder Summary")
+    print("-" * 100)
+    print(f"{'Account':<20}{'Side':<6}{'Asset':<10}{'Amount':<15}{'Status':<11}{'Time(ms)':<10}{'Detail'}")
+    print("-" * 100)
+    for order in orders:
+        latency = f"{order['latency'] * 1000:.0f}" if order['latency'] is not None else "-"
+        print(f"{order['exchange'] + '_' + order['account']:<20}{order['side']:<6}{order['asset']:<10}"
+              f"{order['amount']:<15}{order['status']:<11}{latency:<10}{order['detail']}")
+    print("-" * 100)
+
+    counts = {}
+    for order in orders:
+        counts[order['status']] = counts.get(order['status'], 0) + 1
+    print("  ".join(f"{status.capitalize()}: {count}" for status, count in counts.items()))
@@ -0,0 +1,411 @@
+# feeds.py
+import asyncio
+import json
+import threading
+import time
+from collections.abc import Mapping
+import websockets
+from logger import get_logger
+
+logger = get_logger()
+
+
+class PriceBook:
+    """Thread-safe in-memory book of the latest streamed price per exchange and symbol"""
+
+    def __init__(self):
+        self._prices = {}  # (exchange_name, symbol) -> (price, updated_at)
+        self._lock = threading.Lock()
+
+    def update(self, exchange_name, symbol, price):
+        with self._lock:
+            self._prices[(exchange_name, symbol)] = (price, time.monotonic())
+
+    def get(self, exchange_name, symbol, max_age):
+        """Return the price if it was updated within max_age seconds, else None"""
+        with self._lock:
+            entry = self._prices.get((exchange_name, symbol))
+        if entry and time.monotonic() - entry[1] <= max_age:
+            return entry[0]
+        return None
+
+
+class BookPrices(Mapping):
+    """Price dict for one exchange that reads the live book first.
+    The REST snapshot is only fetched when a symbol is missing from the book or stale."""
+
+    def __init__(self, book, exchange_name, max_age, fetch_rest):
+        self.book = book
+        self.exchange_name = exchange_name
+        self.max_age = max_age
+        self.fetch_rest = fetch_rest
+        self._rest = None
+
+    def _fallback(self):
+        if self._rest is None:
+            self._rest = self.fetch_rest()
+        return self._rest
+
+    def __getitem__(self, symbol):
+        price = self.book.get(self.exchange_name, symbol, self.max_age)
+        if price is not None:
+            return price
+        return self._fallback()[symbol]
+
+    def __contains__(self, symbol):
+        return self.book.get(self.exchange_name, symbol, self.max_age) is not None or symbol in self._fallback()
+
+    def __iter__(self):
+        return iter(self._fallback())
+
+    def __len__(self):
+        return len(self._fallback())
+
+
+# Each feed turns the exchange's public ticker stream into (symbol, price) pairs,
+# using the same symbols as the exchange's get_prices so both sources are interchangeable.
+# add covers more symbols and returns the subscribe messages for the ones not streamed yet
+
+class BinanceFeed:
+    url = "wss://stream.binance.com:9443/ws/!miniTicker@arr"
+
+    def __init__(self, exchange, symbols):
+        pass
+
+    def add(self, exchange, symbols):
+        return []
+
+    def subscriptions(self):
+        # The all-market stream needs no subscribe message
+        return []
+
+    def parse(self, message):
+        if isinstance(message, list):
+            for ticker in message:
+                yield ticker["s"], float(ticker["c"])
+
+
+class KrakenFeed:
+    url = "wss://ws.kraken.com"
+
+    def __init__(self, exchange, symbols):
+        self.pairs = {}
+        self.add(exchange, symbols)
+
+    def add(self, exchange, symbols):
+        # The stream names pairs by wsname (XBT/USD), get_prices by pair key (XXBTZUSD)
+        pairs = exchange.get_asset_pairs()
+        new = {
+            info["wsname"]: pair for pair, info in pairs.items()
+            if pair in symbols and "wsname" in info and info.get("quote") in ("ZUSD", "USDT")
+            and info["wsname"] not in self.pairs
+        }
+        self.pairs.update(new)
+        return [self.subscription(list(new))] if new else []
+
+    def subscriptions(self):
+        return [self.subscription(list(self.pairs))]
+
+    @staticmethod
+    def subscription(wsnames):
+        return {"event": "subscribe", "pair": wsnames, "subscription": {"name": "ticker"}}
+
+    def parse(self, message):
+        # [channelID, {"c": [last_price, lot_volume], ...}, "ticker", "XBT/USD"]
+        if isinstance(message, list) and len(message) >= 4 and message[-2] == "ticker":
+            pair = self.pairs.get(message[-1])
+            if pair:
+                yield pair, float(message[1]["c"][0])
+
+
+class BitfinexFeed:
+    url = "wss://api-pub.bitfinex.com/ws/2"
+
+    def __init__(self, exchange, symbols):
+        self.symbols = []
+        self.channels = {}  # chanId -> symbol
+        self.add(exchange, symbols)
+
+    def add(self, exchange, symbols):
+        new = [symbol for symbol in symbols if symbol.startswith("t") and symbol not in self.symbols]
+        self.symbols += new
+        return [self.subscription(symbol) for symbol in new]
+
+    def subscriptions(self):
+        return [self.subscription(symbol) for symbol in self.symbols]
+
+    @staticmethod
+    def subscription(symbol):
+        return {"event": "subscribe", "channel": "ticker", "symbol": symbol}
+
+    def parse(self, message):
+        if isinstance(message, dict):
+            if message.get("event") == "subscribed":
+                self.channels[message["chanId"]] = message["symbol"]
+            return
+        # [chanId, [BID, BID_SIZE, ASK, ASK_SIZE, DAILY_CHANGE, DAILY_CHANGE_RELATIVE, LAST_PRICE, ...]], heartbeats are [chanId, "hb"]
+        if isinstance(message, list) and len(message) > 1 and isinstance(message[1], list):
+            symbol = self.channels.get(message[0])
+            if symbol:
+                yield symbol, float(message[1][6])
+
+
+class CoinbaseFeed:
+    url = "wss://advanced-trade-ws.coinbase.com"
+
+    def __init__(self, exchange, symbols):
+        self.product_ids = []
+        self.add(exchange, symbols)
+
+    def add(self, exchange, symbols):
+        new = [symbol for symbol in symbols if symbol.endswith("-USD") and symbol not in self.product_ids]
+        self.product_ids += new
+        return [self.subscription(new)] if new else []
+
+    def subscriptions(self):
+        return [self.subscription(self.product_ids)]
+
+    @staticmethod
+    def subscription(product_ids):
+        return {"type": "subscribe", "product_ids": product_ids, "channel": "ticker"}
+
+    def parse(self, message):
+        if isinstance(message, dict) and message.get("channel") == "ticker":
+            for event in message.get("events", []):
+                for ticker in event.get("tickers", []):
+                    yield ticker["product_id"], float(ticker["price"])
+
+
+FEEDS = {
+    'binance': BinanceFeed,
+    'kraken': KrakenFeed,
+    'bitfinex': BitfinexFeed,
+    'coinbase': CoinbaseFeed,
+}
+
+
+class PriceFeeds:
+    """Runs the ticker streams of all exchanges on one background event loop, writing into a PriceBook"""
+
+    def __init__(self, book):
+        self.book = book
+        self._loop = None
+        self._feeds = {}    # exchange_name -> feed
+        self._covered = {}  # exchange_name -> balance codes the feed streams prices for, None for all of them
+        self._sockets = {}  # exchange_name -> open connection of the feed
+        self._lock = threading.Lock()
+
+    def covers(self, exchange_name, assets=None):
+        """True when the exchange's feed streams the prices needed to value the balance codes assets"""
+        with self._lock:
+            if exchange_name not in self._feeds:
+                return False
+            covered = self._covered[exchange_name]
+            return covered is None or assets is not None and covered.issuperset(assets)
+
+    def start(self, exchange_name, exchange, symbols, assets=None, url=None):
+        """Stream prices for the exchange, symbols are the ones its get_prices returned for assets (None when it
+        returned every price). Once running, the symbols of assets it did not cover yet are added to the stream."""
+        if exchange_name not in FEEDS:
+            return
+        # Exchanges without prices_by_asset return every price, any snapshot covers every asset
+        covered = set(assets) if assets is not None and exchange.prices_by_asset else None
+        with self._lock:
+            feed = self._feeds.get(exchange_name)
+            if feed is not None:
+                if self._covered[exchange_name] is not None:
+                    self._covered[exchange_name] = None if covered is None else self._covered[exchange_name] | covered
+                subscriptions = feed.add(exchange, set(symbols))
+                if subscriptions:
+                    asyncio.run_coroutine_threadsafe(self._subscribe(exchange_name, subscriptions), self._loop)
+                return
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            feed = self._feeds[exchange_name] = FEEDS[exchange_name](exchange, set(symbols))
+            self._covered[exchange_name] = covered
+        asyncio.run_coroutine_threadsafe(self._run(exchange_name, feed, url or feed.url), self._loop)
+
+    async def _subscribe(self, exchange_name, subscriptions):
+        # While disconnected there is nothing to send, the reconnect subscribes to every symbol of the feed
+        ws = self._sockets.get(exchange_name)
+        if ws is None:
+            return
+        try:
+            for subscription in subscriptions:
+                await ws.send(json.dumps(subscription))
+        except Exception as e:
+            logger.error(f"Cannot add symbols to the price feed for {exchange_name}: {e}")
+
+    async def _run(self, exchange_name, feed, url):
+        delay = 1
+        while True:
+            try:
+                async with websockets.connect(url, max_size=None) as ws:
+                    # Set first, symbols added while subscribing are then sent too rather than dropped
+                    self._sockets[exchange_name] = ws
+                    for subscription in feed.subscriptions():
+                        await ws.send(json.dumps(subscription))
+                    delay = 1
+                    async for raw in ws:
+                        for symbol, price in feed.parse(json.loads(raw)):
+                            self.book.update(exchange_name, symbol, price)
+            except Exception as e:
+                logger.error(f"Price feed for {exchange_name} disconnected: {e}")
+            finally:
+                self._sockets.pop(exchange_name, None)
+            # Stale entries fall back to REST while we reconnect
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+
+# Each account feed turns the exchange's private stream into (balance code, amount) pairs, using the same codes
+# and amounts as the exchange's get_balance so a streamed update replaces the polled balance of that code
+
+class BinanceAccountFeed:
+    """User data stream, opened with a listen key that expires unless kept alive"""
+    url = "wss://stream.binance.com:9443/ws/"
+    keepalive_interval = 30 * 60
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.listen_key = None
+
+    def connect(self, url):
+        self.listen_key = self.exchange.get_stream_token()
+        return url + self.listen_key
+
+    def keepalive(self):
+        self.exchange.keep_stream_alive(self.listen_key)
+
+    def subscriptions(self):
+        return []
+
+    def parse(self, message):
+        # {"e": "outboundAccountPosition", "B": [{"a": "BTC", "f": "0.1", "l": "0"}]}, only the assets that changed
+        if isinstance(message, dict) and message.get("e") == "outboundAccountPosition":
+            for balance in message["B"]:
+                yield balance["a"], float(balance["f"])
+
+
+class KrakenAccountFeed:
+    """Balances channel of the authenticated websocket, which names assets BTC where balances say XXBT"""
+    url = "wss://ws-auth.kraken.com/v2"
+    keepalive_interval = None
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.token = None
+        # Stream asset name -> balance code, from the pairs catalogue: base XXBT trades as XBT/USD
+        self.codes = {}
+        for info in exchange.get_asset_pairs().values():
+            if "wsname" in info:
+                name = info["wsname"].split("/")[0]
+                self.codes[exchange.aliases.get(name, name)] = info["base"]
+
+    def connect(self, url):
+        self.token = self.exchange.get_stream_token()
+        return url
+
+    def subscriptions(self):
+        return [{"method": "subscribe", "params": {"channel": "balances", "token": self.token}}]
+
+    def parse(self, message):
+        # {"channel": "balances", "type": "snapshot" or "update", "data": [{"asset": "BTC", "balance": 1.5, ...}]}
+        if isinstance(message, dict) and message.get("channel") == "balances":
+            for balance in message.get("data", []):
+                yield self.codes.get(balance["asset"], balance["asset"]), float(balance["balance"])
+
+
+class BitfinexAccountFeed:
+    """Wallet updates of the authenticated websocket"""
+    url = "wss://api.bitfinex.com/ws/2"
+    keepalive_interval = None
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        # currency -> {wallet type: balance} in the order Bitfinex lists them, as get_balance reads them
+        self.wallets = {}
+
+    def connect(self, url):
+        return url
+
+    def subscriptions(self):
+        return [self.exchange.stream_auth()]
+
+    def parse(self, message):
+        # [0, "ws", [[WALLET_TYPE, CURRENCY, BALANCE, ...], ...]] on connect, then [0, "wu", [WALLET_TYPE, CURRENCY, BALANCE, ...]]
+        if not (isinstance(message, list) and len(message) > 2 and message[0] == 0 and message[1] in ("ws", "wu")):
+            return
+        rows = message[2] if message[1] == "ws" else [message[2]]
+        for wallet_type, currency, balance, *_ in rows:
+            self.wallets.setdefault(currency, {})[wallet_type] = float(balance)
+            # get_balance keeps the last listed wallet with a positive balance
+            positive = [amount for amount in self.wallets[currency].values() if amount > 0]
+            yield currency, positive[-1] if positive else 0.0
+
+
+ACCOUNT_FEEDS = {
+    'binance': BinanceAccountFeed,
+    'kraken': KrakenAccountFeed,
+    'bitfinex': BitfinexAccountFeed,
+}
+
+
+class AccountFeeds:
+    """Runs the private balance streams of accounts on one background event loop.
+    Each stream puts (exchange, account, event, changes) on the queue it was started with: event is connected,
+    balances (changes maps balance codes to their new amount) or disconnected."""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def start(self, exchange_name, account_name, exchange, updates, url=None):
+        """Start streaming the account's balance changes, returns a future whose cancel() stops the stream"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+
+        feed = ACCOUNT_FEEDS[exchange_name](exchange)
+        return asyncio.run_coroutine_threadsafe(
+            self._run(exchange_name, account_name, feed, url or feed.url, updates), self._loop)
+
+    async def _keepalive(self, feed):
+        while True:
+            await asyncio.sleep(feed.keepalive_interval)
+            await asyncio.get_running_loop().run_in_executor(None, feed.keepalive)
+
+    async def _run(self, exchange_name, account_name, feed, url, updates):
+        delay = 1
+        loop = asyncio.get_running_loop()
+        while True:
+            keepalive = None
+            try:
+                # Listen keys and tokens come from a REST call, keep it off the event loop
+                connect_url = await loop.run_in_executor(None, feed.connect, url)
+                async with websockets.connect(connect_url, max_size=None) as ws:
+                    for subscription in feed.subscriptions():
+                        await ws.send(json.dumps(subscription))
+                    if feed.keepalive_interval:
+                        keepalive = asyncio.create_task(self._keepalive(feed))
+                    updates.put((exchange_name, account_name, 'connected', None))
+                    delay = 1
+                    async for raw in ws:
+                        changes = dict(feed.parse(json.loads(raw)))
+                        if changes:
+                            updates.put((exchange_name, account_name, 'balances', changes))
+            except Exception as e:
+                logger.error(f"Account feed for {exchange_name}_{account_name} disconnected: {e}")
+            finally:
+                if keepalive:
+                    keepalive.cancel()
+            updates.put((exchange_name, account_name, 'disconnected', None))
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+
+price_book = PriceBook()
+price_feeds = PriceFeeds(price_book)
+account_feeds = AccountFeeds()
@@ -1,9 +1,71 @@
 # logger.py
+import atexit
+import json
 import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
 
-# Setup logging
-logging.basicConfig(filename='trade.log', level=logging.INFO, format='%(asctime)s - %(message)s')
+LOG_FILE = 'trade.log'
+
+# Append-only record of every order, one JSON object per line
+ORDER_JOURNAL = 'orders.jsonl'
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queues the record as it is, formatting and file I/O both happen on the listener thread"""
+
+    def prepare(self, record):
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records whose msg is a dict as one line of JSON, SDK response objects are written as their repr"""
+
+    def format(self, record):
+        return json.dumps(record.msg, default=str)
+
+
+# Setup logging, callers only put records on a queue and one background thread writes them
+log_queue = queue.SimpleQueue()
+
+file_handler = logging.FileHandler(LOG_FILE)
+file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
 logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(DeferredQueueHandler(log_queue))
+
+journal_handler = logging.FileHandler(ORDER_JOURNAL, delay=True)
+journal_handler.setFormatter(JSONFormatter())
+journal = logging.getLogger('orders')
+journal.propagate = False
+journal.addHandler(DeferredQueueHandler(log_queue))
+
+# Each record goes to the handler of its own logger only
+file_handler.addFilter(lambda record: record.name != 'orders')
+journal_handler.addFilter(lambda record: record.name == 'orders')
+
+listener = QueueListener(log_queue, file_handler, journal_handler)
+listener.start()
+# Write out whatever is still queued when the process exits
+atexit.register(listener.stop)
 
 def get_logger():
     return logger
+
+def journal_order(order, exchange=None):
+    """Queue a JSON line with the outcome of an order record, exchange (when given) extracts the order id"""
+    response = order.get('response')
+    journal.info({
+        'timestamp': time.time(),
+        'exchange': order['exchange'],
+        'account': order['account'],
+        'asset': order['asset'],
+        'side': order['side'],
+        'qty': order['amount'],
+        'status': order['status'],
+        'detail': order['detail'],
+        'latency': order['latency'],
+        'order_id': exchange.order_id(response) if exchange is not None and response is not None else None,
+        'response': response,
+    })
@@ -1,31 +1,133 @@
+import time
+
+# Taken before the other imports so --profile-startup can report what they cost
+started = time.perf_counter()
+
+import argparse
 import os
-from dotenv import load_dotenv
-from commands import execute_command
+import sys
+from commands import execute_command, warm_start
+from config import load_config, ConfigError
+from exchanges import load_adapter, adapter_load_times
 from logger import get_logger
 
-logger = get_logger()
+imports_done = time.perf_counter()
 
-# Load environment variables from .env file
-load_dotenv()
+logger = get_logger()
 
 print(" " * 60)
 print(f"SANDBOX = {os.getenv('EXCHANGE_SANDBOX', False)}")
 print(" " * 60)
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Manage balances and trades across exchange accounts")
+    parser.add_argument("-c", "--command", action="append", default=[],
+                        help="command to run, can be repeated, eg: -c \"balance all\" -c \"sell 50 kraken_monu\"")
+    parser.add_argument("-f", "--file", help="file with one command per line, - reads from stdin")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report the time spent on imports, config and the configured exchange SDKs")
+    parser.add_argument("--daemon", action="store_true",
+                        help="stay in the background with warm clients and caches, run commands sent with client.py")
+    return parser.parse_args()
+
+
+def read_commands(file):
+    """Return the commands in a script, skipping blank lines and # comments"""
+    lines = file.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
+
+def print_startup_profile(config, config_time):
+    """Print where the time to the first command goes. The SDKs of the configured exchanges are loaded here,
+    as the first command would load them, so each one's import cost shows up on its own line."""
+    timings = [("module imports", imports_done - started), ("config", config_time)]
+    for exchange_name in config.get('accounts', {}):
+        try:
+            load_adapter(exchange_name)
+            timings.append((f"{exchange_name} adapter", adapter_load_times.get(exchange_name.lower(), 0)))
+        except Exception as e:
+            print(f"❌ Error loading {exchange_name} adapter: {e}")
+
+    print(f"{'Startup':<30}{'Time (ms)':>12}")
+    print("-" * 42)
+    for name, seconds in timings:
+        print(f"{name:<30}{seconds * 1000:>12.1f}")
+    print("-" * 42)
+    print(f"{'total':<30}{(time.perf_counter() - started) * 1000:>12.1f}")
+    print(" " * 60)
+
+
+def run_batch(commands):
+    """Run every command in this process so they share the warm clients and caches.
+    Returns the exit code, 1 when any command failed."""
+    failed = 0
+    for command in commands:
+        print(f"$ {command}")
+        try:
+            if execute_command(command) is False:
+                failed += 1
+        except KeyboardInterrupt:
+            print("\nExiting...")
+            return 130
+        except Exception as e:
+            print(f"Error: {e}")
+            logger.error(f"Error running '{command}': {e}")
+            failed += 1
+        print(" " * 60)
+    if failed:
+        print(f"{failed} of {len(commands)} commands failed")
+    return 1 if failed else 0
+
+
 def main():
+    args = parse_args()
+
+    # A broken config stops here instead of in the middle of the first command
+    config_started = time.perf_counter()
+    try:
+        config = load_config()
+    except ConfigError as e:
+        print(f"❌ {e}")
+        return 2
+    if args.profile_startup:
+        print_startup_profile(config, time.perf_counter() - config_started)
+
+    # Before stdin is looked at, a daemon started from a script or over ssh may have a pipe there
+    if args.daemon:
+        from daemon import serve
+        return serve()
+
+    commands = list(args.command)
+    if args.file == '-':
+        commands += read_commands(sys.stdin)
+    elif args.file:
+        with open(args.file, "r") as file:
+            commands += read_commands(file)
+    elif not commands and not sys.stdin.isatty():
+        # Piped input, eg: echo "balance all" | python main.py
+        commands = read_commands(sys.stdin)
+
+    # Without a terminal there is nobody to prompt, eg: cron with < /dev/null runs nothing and exits
+    if commands or args.file or not sys.stdin.isatty():
+        return run_batch(commands)
+
+    # Show the last known portfolio while every account refreshes in the background
+    warm_start()
+
     # Command loop
     while True:
         try:
             command = input("💰$$$ ")
             execute_command(command)  # Pass the logger to execute_command
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):
             print("\nExiting...")
             print(" " * 60)
             break
         except Exception as e:
             print(f"Error: {e}")
             logger.error(f"Error: {e}")
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
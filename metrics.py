@@ -0,0 +1,138 @@
+# metrics.py
+import bisect
+import contextlib
+import math
+import os
+import threading
+import time
+from collections import deque
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Recent durations kept per series for the percentiles shown by the stats command
+SAMPLES = 1000
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a sorted list"""
+    index = max(0, min(len(values) - 1, math.ceil(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=SAMPLES)
+
+    def observe(self, seconds, ok):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.errors += not ok
+        self.sum += seconds
+        self.samples.append(seconds)
+
+    def percentile(self, percent):
+        return percentile(sorted(self.samples), percent) if self.samples else 0.0
+
+
+class Metrics:
+    """In-process latency histograms and counters keyed by (operation or counter name, exchange, account)"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def observe(self, operation, seconds, exchange_name='', account_name='', ok=True):
+        key = (operation, exchange_name, account_name)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds, ok)
+            for spans in self._collectors:
+                spans.append((operation, exchange_name, account_name, seconds, ok))
+
+    def count(self, name, exchange_name='', account_name='', value=1):
+        key = (name, exchange_name, account_name)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def span(self, operation, exchange_name='', account_name=''):
+        """Time the block as one observation of operation, failed when it raises"""
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.observe(operation, time.perf_counter() - start, exchange_name, account_name, ok)
+
+    @contextlib.contextmanager
+    def collect(self):
+        """Yield a list that receives (operation, exchange, account, seconds, ok) for every span ending inside the block,
+        from any thread"""
+        spans = []
+        with self._lock:
+            self._collectors.append(spans)
+        try:
+            yield spans
+        finally:
+            with self._lock:
+                self._collectors.remove(spans)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def prometheus(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        def labels(operation_label, operation, exchange_name, account_name, le=None):
+            bound = f',le="{le}"' if le is not None else ''
+            return f'{{{operation_label}="{operation}",exchange="{exchange_name}",account="{account_name}"{bound}}}'
+
+        lines = [
+            "# HELP asset_manager_span_seconds Duration of exchange calls and command phases.",
+            "# TYPE asset_manager_span_seconds histogram",
+        ]
+        with self._lock:
+            for (operation, exchange_name, account_name), histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram.buckets):
+                    cumulative += count
+                    lines.append(f"asset_manager_span_seconds_bucket"
+                                 f"{labels('operation', operation, exchange_name, account_name, bound)} {cumulative}")
+                lines.append(f"asset_manager_span_seconds_sum{labels('operation', operation, exchange_name, account_name)} {histogram.sum}")
+                lines.append(f"asset_manager_span_seconds_count{labels('operation', operation, exchange_name, account_name)} {histogram.count}")
+
+            lines += [
+                "# HELP asset_manager_span_errors_total Exchange calls and command phases that raised.",
+                "# TYPE asset_manager_span_errors_total counter",
+            ]
+            for (operation, exchange_name, account_name), histogram in sorted(self.histograms.items()):
+                lines.append(f"asset_manager_span_errors_total{labels('operation', operation, exchange_name, account_name)} {histogram.errors}")
+
+            lines += [
+                "# HELP asset_manager_events_total Retries, timeouts, skipped accounts and other events.",
+                "# TYPE asset_manager_events_total counter",
+            ]
+            for (name, exchange_name, account_name), value in sorted(self.counters.items()):
+                lines.append(f"asset_manager_events_total{labels('event', name, exchange_name, account_name)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the metrics for the node exporter textfile collector, replacing the file in one step"""
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as file:
+            file.write(self.prometheus())
+        os.replace(temp_path, path)
+
+
+metrics = Metrics()
@@ -0,0 +1,78 @@
+# portfolio.py
+import numpy as np
+
+# Columns the per-asset view can be sorted by, numbers sort largest first
+SORT_KEYS = ['value', 'amount', 'weight', 'asset']
+
+
+class PortfolioTable:
+    """Columnar table of holdings, one row per asset per exchange-account.
+    Assets are canonical names so the same coin held on several exchanges (XXBT, BTC) adds up."""
+
+    def __init__(self, assets, exchanges, accounts, amounts, prices):
+        self.assets = np.asarray(assets, dtype=object)
+        self.exchanges = np.asarray(exchanges, dtype=object)
+        self.accounts = np.asarray(accounts, dtype=object)
+        self.amounts = np.asarray(amounts, dtype=float)
+        # NaN where the exchange had no USD price for the asset
+        self.prices = np.asarray(prices, dtype=float)
+        self.values = self.amounts * self.prices
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build the table from (asset, exchange, account, amount, price) rows, price None when unknown"""
+        if not rows:
+            return cls([], [], [], [], [])
+        assets, exchanges, accounts, amounts, prices = zip(*rows)
+        return cls(assets, exchanges, accounts, amounts, [np.nan if price is None else price for price in prices])
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def where(self, mask):
+        """Return the rows selected by a boolean mask as a new table"""
+        table = PortfolioTable.__new__(PortfolioTable)
+        for column in ('assets', 'exchanges', 'accounts', 'amounts', 'prices', 'values'):
+            setattr(table, column, getattr(self, column)[mask])
+        return table
+
+    def filter(self, asset=None, exchange_name=None):
+        mask = np.ones(len(self), dtype=bool)
+        if asset:
+            mask &= self.assets == asset
+        if exchange_name:
+            mask &= self.exchanges == exchange_name
+        return self.where(mask)
+
+    def total(self):
+        return np.nansum(self.values)
+
+    def unpriced(self):
+        """Assets held without a USD price, they count as 0 in the totals"""
+        return sorted(set(self.assets[np.isnan(self.values)]))
+
+    def by_asset(self, sort='value', min_value=0):
+        """Aggregate per asset: returns (assets, amounts, values, weights, exchange names, per-exchange values matrix)
+        sorted by sort and without the assets worth less than min_value"""
+        assets, asset_index = np.unique(self.assets.astype(str), return_inverse=True)
+        exchanges, exchange_index = np.unique(self.exchanges.astype(str), return_inverse=True)
+        values = np.nan_to_num(self.values)
+
+        amounts = np.bincount(asset_index, weights=self.amounts, minlength=len(assets))
+        totals = np.bincount(asset_index, weights=values, minlength=len(assets))
+        # One cell per (asset, exchange), summed over that exchange's accounts
+        cells = asset_index * len(exchanges) + exchange_index
+        per_exchange = np.bincount(cells, weights=values, minlength=len(assets) * len(exchanges))
+        per_exchange = per_exchange.reshape(len(assets), len(exchanges))
+
+        grand_total = totals.sum()
+        weights = totals / grand_total if grand_total else np.zeros_like(totals)
+
+        keep = totals >= min_value
+        if sort == 'asset':
+            order = np.argsort(assets[keep], kind='stable')
+        else:
+            column = {'value': totals, 'amount': amounts, 'weight': weights}[sort][keep]
+            order = np.argsort(-column, kind='stable')
+        return (assets[keep][order], amounts[keep][order], totals[keep][order], weights[keep][order],
+                exchanges, per_exchange[keep][order])
@@ -0,0 +1,47 @@
+# quantity.py
+from decimal import Decimal, ROUND_DOWN
+from cache import TTLCache
+from symbols import MARKET_CACHE_TTL, load_markets
+from utils import amount_trade
+
+# Order size rules per exchange, keyed by balance asset code
+market_rules = TTLCache(ttl=MARKET_CACHE_TTL)
+
+
+def build_market_rules(exchange):
+    """Index the markets orders are placed on (base against the exchange's fiat) by balance asset code"""
+    rules = {}
+    for market in load_markets(exchange):
+        if market['quote_asset'] != exchange.fiat:
+            continue
+        for code in [market['base']] + market.get('base_codes', []):
+            rules[code] = market
+    return rules
+
+
+def get_market_rules(exchange):
+    """Get the shared order size rules of the exchange, loaded from the cached market metadata"""
+    return market_rules.get(exchange.exchange_name, lambda: build_market_rules(exchange))
+
+
+def order_quantity(rules, asset, amount, percent, price):
+    """Return (quantity, skip_reason) for trading percent of amount.
+    The quantity is rounded down to the market's step size, skip_reason is set when the exchange would reject it."""
+    rule = rules.get(asset) or rules.get(asset.split('.')[0])
+    if rule is None:
+        # No market metadata for the asset, fall back to guessing the decimals
+        return amount_trade(asset, amount, percent), None
+
+    quantity = Decimal(str(amount)) * Decimal(str(percent)) / 100
+    if rule['step']:
+        step = Decimal(str(rule['step']))
+        quantity = (quantity / step).to_integral_value(rounding=ROUND_DOWN) * step
+    quantity = float(quantity)
+
+    if quantity <= 0:
+        return quantity, "rounds down to zero"
+    if rule['min_qty'] and quantity < rule['min_qty']:
+        return quantity, f"below minimum quantity {rule['min_qty']}"
+    if rule['min_notional'] and price and quantity * price < rule['min_notional']:
+        return quantity, f"below minimum order value {rule['min_notional']}"
+    return quantity, None
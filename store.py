@@ -0,0 +1,140 @@
+# store.py
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from logger import get_logger
+
+logger = get_logger()
+
+# Local database of balance snapshots, kept across sessions
+SNAPSHOT_DB = "snapshots.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS balance_snapshots (
+    id INTEGER PRIMARY KEY,
+    taken_at REAL NOT NULL,
+    exchange TEXT NOT NULL,
+    account TEXT NOT NULL,
+    total_usd REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_balance_snapshots_account ON balance_snapshots (exchange, account, taken_at);
+CREATE INDEX IF NOT EXISTS idx_balance_snapshots_taken_at ON balance_snapshots (taken_at);
+
+CREATE TABLE IF NOT EXISTS asset_snapshots (
+    snapshot_id INTEGER NOT NULL REFERENCES balance_snapshots (id),
+    asset TEXT NOT NULL,
+    amount REAL NOT NULL,
+    price REAL,
+    usd_value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_asset_snapshots_snapshot ON asset_snapshots (snapshot_id);
+"""
+
+
+class SnapshotStore:
+    """SQLite store of per exchange-account balance snapshots with the price of every asset.
+    Writes go through one background thread so saving never blocks a command."""
+
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.Queue()
+        self._last_saved = {}
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        # WAL lets the REPL read history while the writer thread inserts
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def save_account(self, exchange_name, account_name, balance_data, sorted_assets, total_value):
+        """Queue a snapshot of the account's valued assets, as returned by prepare_balance_for_account"""
+        # Re-reads of the same cached balance are not new snapshots
+        key = (exchange_name, account_name)
+        if self._last_saved.get(key) is balance_data:
+            return
+        self._last_saved[key] = balance_data
+
+        rows = [
+            (asset, amount, usd_value / amount if amount else None, usd_value)
+            for asset, amount, usd_value, _, _ in sorted_assets
+        ]
+        self._start_writer()
+        self._queue.put((time.time(), exchange_name, account_name, total_value, rows))
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer.start()
+                # Do not lose queued snapshots when the process exits
+                atexit.register(self.flush)
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            taken_at, exchange_name, account_name, total_value, rows = self._queue.get()
+            try:
+                with conn:
+                    cursor = conn.execute(
+                        "INSERT INTO balance_snapshots (taken_at, exchange, account, total_usd) VALUES (?, ?, ?, ?)",
+                        (taken_at, exchange_name, account_name, total_value),
+                    )
+                    conn.executemany(
+                        "INSERT INTO asset_snapshots (snapshot_id, asset, amount, price, usd_value) VALUES (?, ?, ?, ?, ?)",
+                        [(cursor.lastrowid, *row) for row in rows],
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"Error saving snapshot for {exchange_name}_{account_name}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until every queued snapshot is written"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def latest(self, exchange_name, account_name):
+        """Return (taken_at, total_usd, [(asset, amount, usd_value), ...]) of the account's last snapshot, or None"""
+        self.flush()
+        conn = self._connect()
+        try:
+            snapshot = conn.execute(
+                "SELECT id, taken_at, total_usd FROM balance_snapshots WHERE exchange = ? AND account = ? "
+                "ORDER BY taken_at DESC LIMIT 1",
+                (exchange_name, account_name),
+            ).fetchone()
+            if snapshot is None:
+                return None
+            assets = conn.execute(
+                "SELECT asset, amount, usd_value FROM asset_snapshots WHERE snapshot_id = ? ORDER BY usd_value DESC",
+                (snapshot[0],),
+            ).fetchall()
+            return snapshot[1], snapshot[2], assets
+        finally:
+            conn.close()
+
+    def history(self, exchange_name=None, account_name=None, since=None):
+        """Return (taken_at, exchange, account, total_usd) rows oldest first, optionally for one exchange or account
+        and only from the since timestamp on"""
+        self.flush()
+        query = "SELECT taken_at, exchange, account, total_usd FROM balance_snapshots WHERE taken_at >= ?"
+        params = [since or 0]
+        if exchange_name:
+            query += " AND exchange = ?"
+            params.append(exchange_name)
+        if account_name:
+            query += " AND account = ?"
+            params.append(account_name)
+        conn = self._connect()
+        try:
+            return conn.execute(query + " ORDER BY taken_at", params).fetchall()
+        finally:
+            conn.close()
+
+
+snapshot_store = SnapshotStore(SNAPSHOT_DB)
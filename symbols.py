@@ -0,0 +1,66 @@
+# symbols.py
+from cache import TTLCache, load_json
+
+# Quote assets a price can be read from, in order of preference
+USD_QUOTES = ["USD", "USDT", "USDC"]
+
+# Market metadata rarely changes, it is kept on disk and in memory for a day
+MARKET_CACHE_TTL = 24 * 60 * 60
+symbol_indexes = TTLCache(ttl=MARKET_CACHE_TTL)
+
+
+class SymbolIndex:
+    """Maps the asset codes an exchange uses in balances to their canonical asset and USD pricing symbols.
+    Built from the normalized markets returned by ExchangeBase.get_markets()."""
+
+    def __init__(self, markets):
+        self.assets = {}   # balance code -> canonical asset, eg: XXBT -> BTC
+        self.symbols = {}  # balance code -> pricing symbols, best quote first, eg: XXBT -> ["XXBTZUSD", "XBTUSDT"]
+
+        ranked = {}
+        for market in markets:
+            self.assets[market['quote']] = market['quote_asset']
+            # base_codes lists other codes the exchange uses for the same asset in balances
+            for code in [market['base']] + market.get('base_codes', []):
+                self.assets[code] = market['base_asset']
+                if market['quote_asset'] in USD_QUOTES and market['base_asset'] not in USD_QUOTES:
+                    rank = USD_QUOTES.index(market['quote_asset'])
+                    ranked.setdefault(code, []).append((rank, market['symbol']))
+
+        for code, candidates in ranked.items():
+            self.symbols[code] = [symbol for _, symbol in sorted(candidates)]
+
+    def resolve(self, code):
+        """Return the balance code the index knows the asset by, staking variants like XBT.F resolve to XBT"""
+        if code in self.assets:
+            return code
+        base = code.split('.')[0]
+        return base if base in self.assets else code
+
+    def canonical(self, code):
+        code = self.resolve(code)
+        return self.assets.get(code, code)
+
+    def usd_value(self, code, amount, prices):
+        """Return the USD value of amount of the asset, or None when no USD price is available"""
+        code = self.resolve(code)
+        if self.assets.get(code, code) in USD_QUOTES:
+            return amount * 1
+
+        # Unknown codes fall back to the common ASSET+QUOTE naming
+        symbols = self.symbols.get(code) or [code + quote for quote in USD_QUOTES]
+        for symbol in symbols:
+            price = prices[symbol] if symbol in prices else None
+            if price:
+                return amount * price
+        return None
+
+
+def load_markets(exchange):
+    """Get the exchange's markets from the disk cache, fetching them when the cache has expired"""
+    return load_json(f"markets_{exchange.exchange_name}", MARKET_CACHE_TTL, exchange.get_markets)
+
+
+def get_symbol_index(exchange):
+    """Get the shared symbol index of the exchange, building it from its market metadata on first use"""
+    return symbol_indexes.get(exchange.exchange_name, lambda: SymbolIndex(load_markets(exchange)))
@@ -0,0 +1,35 @@
+import types
+import pytest
+
+pytest.importorskip("bfxapi")
+
+from exchanges.bitfinex import Bitfinex
+from executor import new_order
+
+
+def make_bitfinex(account_name, post):
+    """A Bitfinex adapter whose order multi-op request is answered by post(path, body)"""
+    exchange = Bitfinex.__new__(Bitfinex)
+    exchange.account_name, exchange.exchange_name, exchange.rate_key = account_name, 'bitfinex', account_name
+    exchange.client = types.SimpleNamespace(rest=types.SimpleNamespace(auth=types.SimpleNamespace(_m=types.SimpleNamespace(post=post))))
+    return exchange
+
+
+def op_result(status, order=None, text=""):
+    return [0, "on-req", None, None, order, None, status, text]
+
+
+def orders(*assets):
+    return [new_order('bitfinex', 'test', 'sell', asset, 1.0) for asset in assets]
+
+
+def test_maps_each_op_notification_to_its_order():
+    answer = [0, "ox_multi-req", None, None,
+              [op_result("SUCCESS", [101]), op_result("ERROR", text="not enough balance")], None, "SUCCESS", ""]
+    batch = orders('BTC', 'ETH', 'XRP')
+    make_bitfinex('mapping', lambda path, body: answer).submit_orders(batch)
+
+    assert [order['status'] for order in batch] == ['sent', 'rejected', 'error']
+    assert batch[0]['response'] == [101]
+    assert batch[1]['detail'] == "not enough balance"
+    assert batch[2]['detail'] == "no result returned for the order"
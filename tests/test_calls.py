@@ -0,0 +1,63 @@
+import time
+import types
+import pytest
+
+from exchanges import call_policy
+from exchanges.exchange_base import ExchangeBase
+from executor import new_order
+
+
+class Hung(ExchangeBase):
+    """An exchange whose orders never get an answer"""
+
+    def get_balance(self):
+        return {}
+
+    def get_prices(self):
+        return {}
+
+    def buy(self, asset, amount):
+        time.sleep(1)
+
+    def sell(self, asset, amount):
+        time.sleep(1)
+
+
+def orders(exchange_name, *assets):
+    return [new_order(exchange_name, 'test', 'sell', asset, 1.0) for asset in assets]
+
+
+def test_orders_skipped_by_an_open_circuit_are_unsent(monkeypatch):
+    monkeypatch.setitem(call_policy, 'timeout', 0.05)
+    monkeypatch.setitem(call_policy, 'failures', 2)
+    batch = orders('hung', 'BTC', 'ETH', 'XRP', 'LTC')
+    Hung('circuit', 'hung').submit_orders(batch)
+
+    assert [order['status'] for order in batch] == ['error', 'error', 'unsent', 'unsent']
+    assert "skipped after 2 failures" in batch[2]['detail']
+
+
+def test_a_timed_out_bitfinex_chunk_is_marked_and_later_chunks_still_go_out(monkeypatch):
+    pytest.importorskip("bfxapi")
+    from exchanges.bitfinex import Bitfinex
+
+    monkeypatch.setattr(Bitfinex, 'batch_size', 1)
+    monkeypatch.setitem(call_policy, 'timeout', 0.2)
+    calls = []
+
+    def post(path, body):
+        calls.append(body)
+        if len(calls) == 1:
+            time.sleep(0.5)
+        return [0, "ox_multi-req", None, None, [[0, "on-req", None, None, [7], None, "SUCCESS", ""]], None, "SUCCESS", ""]
+
+    exchange = Bitfinex.__new__(Bitfinex)
+    exchange.account_name, exchange.exchange_name, exchange.rate_key = 'timeout', 'bitfinex', 'timeout'
+    exchange.client = types.SimpleNamespace(rest=types.SimpleNamespace(auth=types.SimpleNamespace(_m=types.SimpleNamespace(post=post))))
+    batch = orders('bitfinex', 'BTC', 'ETH')
+    exchange.submit_orders(batch)
+
+    assert len(calls) == 2
+    assert batch[0]['status'] == 'error'
+    assert "may still have been placed" in batch[0]['detail']
+    assert batch[1]['status'] == 'sent'
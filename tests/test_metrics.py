@@ -0,0 +1,9 @@
+from metrics import percentile
+
+
+def test_percentile_is_nearest_rank():
+    assert percentile([1, 2], 50) == 1
+    assert percentile([1, 2, 3, 4, 5, 6], 50) == 3
+    assert percentile([1, 2, 3, 4, 5, 6], 99) == 6
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile([7], 0) == 7
@@ -0,0 +1,52 @@
+from quantity import order_quantity
+from utils import amount_trade
+
+
+def rule(step=None, min_qty=None, min_notional=None):
+    return {'symbol': 'TESTUSD', 'base': 'TEST', 'quote': 'USD', 'step': step, 'min_qty': min_qty, 'min_notional': min_notional}
+
+
+def test_rounds_down_to_the_step_without_float_error():
+    # 0.3 * 10 / 100 is 0.030000000000000002 in floats, Decimal keeps it on the step
+    assert order_quantity({'TEST': rule(step=0.01)}, 'TEST', 0.3, 10, 1) == (0.03, None)
+    assert order_quantity({'TEST': rule(step=0.001)}, 'TEST', 1.23456789, 50, 1) == (0.617, None)
+
+
+def test_never_rounds_up():
+    quantity, skip_reason = order_quantity({'TEST': rule(step=1)}, 'TEST', 19.99, 50, 1)
+    assert (quantity, skip_reason) == (9, None)
+
+
+def test_no_step_keeps_the_exact_quantity():
+    assert order_quantity({'TEST': rule()}, 'TEST', 2.5, 20, 1) == (0.5, None)
+
+
+def test_skips_a_quantity_that_rounds_to_zero():
+    assert order_quantity({'TEST': rule(step=0.01)}, 'TEST', 0.001, 10, 1) == (0, "rounds down to zero")
+
+
+def test_skips_below_min_qty():
+    quantity, skip_reason = order_quantity({'TEST': rule(step=0.01, min_qty=1)}, 'TEST', 5, 10, 100)
+    assert quantity == 0.5
+    assert skip_reason == "below minimum quantity 1"
+
+
+def test_skips_below_min_notional():
+    quantity, skip_reason = order_quantity({'TEST': rule(min_notional=10)}, 'TEST', 5, 10, 15)
+    assert quantity == 0.5
+    assert skip_reason == "below minimum order value 10"
+    # 0.5 at 25 is worth 12.5
+    assert order_quantity({'TEST': rule(min_notional=10)}, 'TEST', 5, 10, 25) == (0.5, None)
+
+
+def test_min_notional_is_not_checked_without_a_price():
+    assert order_quantity({'TEST': rule(min_notional=10)}, 'TEST', 5, 10, None) == (0.5, None)
+
+
+def test_staked_codes_use_the_rule_of_their_base_asset():
+    assert order_quantity({'XBT': rule(step=0.0001)}, 'XBT.F', 0.123456, 50, 1) == (0.0617, None)
+
+
+def test_falls_back_to_amount_trade_without_a_rule():
+    for asset, amount, percent in [('XXBT', 0.5, 20), ('DOT', 150, 33), ('ADA', 7.5, 5)]:
+        assert order_quantity({}, asset, amount, percent, 1) == (amount_trade(asset, amount, percent), None)
@@ -1,21 +1,65 @@
-from datetime import datetime
+import contextvars
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from symbols import get_symbol_index
 
-def get_time():
-    # Get the current time
-    now = datetime.now()
+def get_time(timestamp=None):
+    # Get the current time, or the given unix timestamp
+    now = datetime.fromtimestamp(timestamp) if timestamp is not None else datetime.now()
 
     # Format the time as yyyy-dd-mm H:i:s
     formatted_time = now.strftime("%Y-%d-%m %H:%M:%S")
     return formatted_time
 
+def parse_since(value):
+    """Parse a --since value, either a duration back from now (30m, 24h, 7d) or a date (2025-01-31), into a unix timestamp"""
+    units = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+    if value[-1] in units and value[:-1].isdigit():
+        return (datetime.now() - timedelta(**{units[value[-1]]: int(value[:-1])})).timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+# Flags that are on when given and never take a value
+BOOLEAN_FLAGS = {'fresh', 'timings'}
+# Flags that always need a value
+VALUE_FLAGS = {'deadline', 'duration', 'since', 'top', 'min', 'sort', 'file', 'exchange'}
+
+def is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
 def parse_command(command):
-    """Parse a command string into components"""
-    command_parts = command.split()
+    """Parse a command string into components, --name value flags are returned as options.
+    Raises ValueError when a flag that needs a value has none."""
+    command_parts = []
+    options = {}
+    tokens = command.split()
+    while tokens:
+        token = tokens.pop(0)
+        if not token.startswith('--'):
+            command_parts.append(token)
+            continue
+        name = token[2:]
+        has_value = bool(tokens) and not tokens[0].startswith('--')
+        if name in BOOLEAN_FLAGS:
+            options[name] = True
+        elif name in VALUE_FLAGS:
+            if not has_value:
+                raise ValueError(f"--{name} needs a value")
+            options[name] = tokens.pop(0)
+        elif name == 'watch':
+            # An optional poll interval, balance --watch all still watches all
+            options[name] = tokens.pop(0) if has_value and is_number(tokens[0]) else True
+        else:
+            options[name] = tokens.pop(0) if has_value else True
     
     action = command_parts[0]  # The first part will always be the action (e.g., 'buy', 'sell', 'balance')
     
-    # If action is 'balance', the second part will always be a string (the target).
-    if action == 'balance':
+    # For 'balance', 'refresh', 'history', 'stats' and 'portfolio', the second part will always be a string (the target).
+    if action in ['balance', 'refresh', 'history', 'stats', 'portfolio']:
         percent = None
         target = command_parts[1] if len(command_parts) > 1 else 'all'
     else:
@@ -23,7 +67,7 @@ def parse_command(command):
         percent = float(command_parts[1]) if len(command_parts) > 1 and command_parts[1].replace('.', '', 1).isdigit() else None
         target = command_parts[2] if len(command_parts) > 2 else 'all'
 
-    return action, percent, target
+    return action, percent, target, options
 
 
 def filter_assets(balance_data, skip_assets, skip_small_asset_value):
@@ -46,34 +90,17 @@ def calculate_changes(balance_data, percent, action):
             changes[asset] = amount - change_amount
     return changes
 
-def get_asset_usd_value(asset, amount, prices, exchange, stable_fiat = "USDT"):
-    """Get the USD value of an asset using its price in USDT."""
-    # Ensure the asset price is retrieved with the correct symbol (e.g., BTCUSDT)
+def get_asset_usd_value(asset, amount, prices, exchange):
+    """Get the USD value of an asset using the exchange's symbol index to find its USD priced symbol."""
     if not amount: 
         return 0
-    if(exchange.exchange_name == 'kraken'):
-        asset = exchange.replace_code(asset)
-    
-    if(exchange.exchange_name == 'bitfinex'):
-        stable_fiat = "USD"
-        asset = "t"+asset
-    if(exchange.exchange_name == 'coinbase'):
-        stable_fiat = "-USD"
-
-    if asset == "USDT" or asset == "tUSD" or asset == "USD" or asset == "USDC":
-        return amount * 1
-    
-    symbol = asset + stable_fiat  # Assuming all assets are paired with USDT for USD conversion
-    if symbol in prices:
-        price = prices[symbol]
-        return amount * price
-    else:
+
+    usd_value = get_symbol_index(exchange).usd_value(asset, amount, prices)
+    if usd_value is None:
         # Handle case when the price is not found
-        if(exchange.exchange_name == 'kraken' and stable_fiat == "USDT"):
-            return get_asset_usd_value(asset, amount, prices, exchange, "USD")
-        
-        print(f"Warning: Price for {asset} (symbol {symbol}) not found.")
+        print(f"Warning: Price for {asset} on {exchange.exchange_name} not found.")
         return 0
+    return usd_value
 
 
 def sort_assets_by_value(assets):
@@ -87,4 +114,25 @@ def amount_trade(asset, amount, percent):
     if asset in ["BTC", "ETH", "XBT", "XXBT", "XETH"]: decimal = 3
     if percent < 10: decimal = decimal+1
 
-    return round(amount * (percent / 100), decimal)
\ No newline at end of file
+    return round(amount * (percent / 100), decimal)
+
+def run_parallel(func, items, max_workers, timeout=None):
+    """Run func(*item) for every item on a thread pool and yield (item, result, error) in the original order.
+    A call still running timeout seconds after the calls were submitted is reported as a TimeoutError and no longer
+    waited for, the timeout covers all the calls together rather than each in turn."""
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        # Each call runs in a copy of the caller's context, eg: the daemon's output stream of the command
+        futures = [(item, pool.submit(contextvars.copy_context().run, func, *item)) for item in items]
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for item, future in futures:
+            try:
+                remaining = max(0, deadline - time.monotonic()) if deadline is not None else None
+                yield item, future.result(timeout=remaining), None
+            except TimeoutError:
+                yield item, None, TimeoutError(f"timed out after {timeout}s")
+            except Exception as e:
+                yield item, None, e
+    finally:
+        # Do not block on calls that timed out, they finish in the background
+        pool.shutdown(wait=False, cancel_futures=True)
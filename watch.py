@@ -0,0 +1,210 @@
+# watch.py
+import queue
+import sys
+import time
+from commands import get_prices
+from exchanges import get_exchange
+from feeds import ACCOUNT_FEEDS, account_feeds
+from logger import get_logger
+from symbols import get_symbol_index
+from utils import get_time, run_parallel
+
+logger = get_logger()
+
+# Seconds between price checks, prices still come from the price cache or the live price feed
+TICK = 1
+
+
+class WatchedAccount:
+    """Balances of one watched account and the rows last valued from them"""
+
+    def __init__(self, exchange_name, account_name, exchange):
+        self.exchange_name = exchange_name
+        self.account_name = account_name
+        self.exchange = exchange
+        self.balances = {}    # balance code -> amount, as get_balance returns them
+        self.rows = {}        # balance code -> (amount, usd_value) of the assets shown
+        self.order = []       # balance codes in display order, kept until an asset appears or goes
+        self.changed = set()  # codes whose amount changed since the rows were valued
+        self.prices = None    # the prices the rows were valued with
+        self.stream = None    # future of the account feed, None when the account is polled
+        self.streaming = False
+        self.next_poll = 0
+        self.error = None     # of the last balance fetch
+        self.price_error = None
+
+    @property
+    def name(self):
+        return f"{self.exchange_name}_{self.account_name}"
+
+    def apply(self, balances, replace=False):
+        """Record new amounts, replace drops the codes missing from balances (a full fetch)"""
+        old = self.balances
+        self.balances = dict(balances) if replace else {**old, **balances}
+        self.changed |= {code for code in set(old) | set(self.balances) if old.get(code) != self.balances.get(code)}
+
+    def value(self, config):
+        """Value the codes that changed, or every code when the prices moved"""
+        try:
+            prices = get_prices(self.exchange_name, self.exchange, config, list(self.balances))
+        except Exception as e:
+            self.price_error = str(e)
+            return
+        self.price_error = None
+        codes = set(self.balances) | set(self.rows) if prices is not self.prices else self.changed
+        self.prices, self.changed = prices, set()
+
+        index = get_symbol_index(self.exchange)
+        shown = set(self.rows)
+        for code in codes:
+            amount = self.balances.get(code, 0)
+            usd_value = index.usd_value(code, amount, prices) if amount else None
+            if usd_value and usd_value >= config.get('skip_small_asset_usd', 0):
+                self.rows[code] = (amount, usd_value)
+            else:
+                self.rows.pop(code, None)
+        if set(self.rows) != shown:
+            self.order = sorted(self.rows, key=lambda code: self.rows[code][1], reverse=True)
+
+    def lines(self, interval):
+        """Return the (key, text) lines of the account block"""
+        mode = "stream" if self.streaming else f"polling every {interval:g}s"
+        error = self.error or self.price_error
+        header = f"{self.name} ({mode})" + (f"  ❌ {error}" if error else "")
+        lines = [(('account', self.name), header)]
+        for code in self.order:
+            amount, usd_value = self.rows[code]
+            lines.append((('row', self.name, code), f"{code:<20}{amount:<15}{usd_value:<15.2f}{self.name}"))
+        lines.append((('rule', self.name), "-" * 60))
+        lines.append((('total', self.name), f"{'Total Value for Account':<50}{self.total():<15.2f}"))
+        return lines
+
+    def total(self):
+        return sum(usd_value for _, usd_value in self.rows.values())
+
+
+class Screen:
+    """Draws the watch lines. On a terminal only the lines whose text changed are rewritten in place,
+    elsewhere (a pipe, the daemon's client) each changed line is printed once with the time."""
+
+    def __init__(self, out):
+        self.out = out
+        self.tty = out.isatty()
+        self.lines = []  # (key, text) as last drawn
+
+    def draw(self, lines):
+        if self.tty:
+            self._draw_in_place(lines)
+        else:
+            self._draw_changes(lines)
+        self.out.flush()
+        self.lines = lines
+
+    def _draw_in_place(self, lines):
+        height = len(self.lines)
+        if [key for key, _ in lines] != [key for key, _ in self.lines]:
+            # Rows came or went, clear the block and draw it again
+            if height:
+                self.out.write(f"\x1b[{height}F\x1b[J")
+            self.out.write("".join(f"{text}\n" for _, text in lines))
+            return
+        for i, ((_, text), (_, drawn)) in enumerate(zip(lines, self.lines)):
+            if text != drawn:
+                # Up to the line, rewrite it, back down below the block
+                self.out.write(f"\x1b[{height - i}F\x1b[2K{text}\x1b[{height - i}E")
+
+    def _draw_changes(self, lines):
+        drawn = dict(self.lines)
+        stamp = get_time()
+        for key, text in lines:
+            if drawn.get(key) != text:
+                self.out.write(f"{stamp}  {text}\n")
+        keys = {key for key, _ in lines}
+        for key, _ in self.lines:
+            if key[0] == 'row' and key not in keys:
+                self.out.write(f"{stamp}  {key[2]} removed from {key[1]}\n")
+
+
+def watch_balance(target, config, interval=None, duration=None):
+    """Keep the balances of the target on screen until Ctrl-C or duration seconds. Accounts on exchanges with
+    an account stream are fetched once and then follow the stream, the others are polled every interval seconds."""
+    settings = config.get('balance_watch', {})
+    interval = interval or settings.get('interval', 10)
+    updates = queue.SimpleQueue()
+
+    accounts = {}
+    for exchange_name, account_name in config.pairs(target):
+        account = WatchedAccount(exchange_name, account_name, get_exchange(exchange_name, account_name))
+        accounts[(exchange_name, account_name)] = account
+        if settings.get('streams', True) and exchange_name in ACCOUNT_FEEDS:
+            try:
+                account.stream = account_feeds.start(exchange_name, account_name, account.exchange, updates,
+                                                     settings.get('urls', {}).get(exchange_name))
+            except Exception as e:
+                logger.error(f"Cannot stream {account.name}, polling it instead: {e}")
+
+    screen = Screen(sys.stdout)
+    deadline = time.monotonic() + duration if duration else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            poll([account for account in accounts.values() if account.next_poll <= time.monotonic()], config, interval)
+            for account in accounts.values():
+                account.value(config)
+            lines = [(('title',), f"Watching balances of {target}, Ctrl-C to stop")]
+            for account in accounts.values():
+                lines += account.lines(interval)
+            lines.append((('rule',), "=" * 60))
+            lines.append((('total',), f"{'Total Value':<50}{sum(account.total() for account in accounts.values()):<15.2f}"))
+            screen.draw(lines)
+
+            # The daemon's client went away, nobody is watching
+            if not getattr(sys.stdout, 'connected', True):
+                break
+            wait_for_updates(updates, accounts, interval)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        for account in accounts.values():
+            if account.stream is not None:
+                account.stream.cancel()
+    return True
+
+
+def poll(due, config, interval):
+    """Fetch the full balance of the due accounts, the streamed ones only to resync after (re)connecting"""
+    results = run_parallel(lambda account: account.exchange.get_balance(), [(account,) for account in due],
+                           config.get('max_workers', 8), config.call_timeout(1, len(due)))
+    for (account,), balances, error in results:
+        if error:
+            # Streamed accounts too, until the resync succeeds their balances are incomplete
+            account.next_poll = time.monotonic() + interval
+            account.error = str(error)
+            logger.error(f"Error fetching balance for {account.name}: {error}")
+            continue
+        account.next_poll = float('inf') if account.streaming else time.monotonic() + interval
+        account.error = None
+        account.apply(balances, replace=True)
+
+
+def wait_for_updates(updates, accounts, interval):
+    """Wait up to TICK seconds for stream events and apply every event that arrived"""
+    try:
+        events = [updates.get(timeout=TICK)]
+    except queue.Empty:
+        return
+    while True:
+        try:
+            events.append(updates.get_nowait())
+        except queue.Empty:
+            break
+
+    for exchange_name, account_name, event, changes in events:
+        account = accounts[(exchange_name, account_name)]
+        if event == 'balances':
+            account.apply(changes)
+        elif event == 'connected':
+            # Changes made while the stream was down are not replayed, fetch the balance once to catch up
+            account.streaming, account.next_poll = True, 0
+        elif event == 'disconnected':
+            account.streaming = False
+            account.next_poll = min(account.next_poll, time.monotonic() + interval)